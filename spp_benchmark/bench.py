@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+import sys
+import json
+import time
+import random
+import itertools
+import statistics
+
+from spp_benchmark.generator import gao_rexford_topology
+from spp_benchmark.reader import reset_dst
+from spp_benchmark.sgraph import SGraph, CompactSGraph, GreedySolver, GreedyPlusSolver, GreedyPPGraphSolver, \
+    ExactSGraphSolver, PARALLEL_MIN_PATHS
+from spp_benchmark.bgp import bgp_sim, RibBound
+from spp_benchmark.instrument import Instrument
+
+SHAPE_KEYS = ('n', 'depth', 'tier1', 'providers', 'peering')
+
+def shapes(sizes, depths=(3,), tier1s=(4,), providers=((1, 2),), peerings=(0.05,)):
+    """
+    Enumerate the topology shapes of a sweep, one per combination of the
+    given values, as dicts of gao_rexford_topology() arguments.
+    """
+    for values in itertools.product(sizes, depths, tier1s, providers, peerings):
+        yield dict(zip(SHAPE_KEYS, values))
+
+def time_solver(solver, sgraph, repeats=1, warmup=0):
+    """
+    Run `solver` on `sgraph` `warmup` times, then `repeats` times timed
+    with perf_counter_ns. Return (solution, succ, times in ns).
+    """
+    for _ in range(warmup):
+        solver.solve(sgraph)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter_ns()
+        s, ok, _ = solver.solve(sgraph)
+        times.append(time.perf_counter_ns() - start)
+    return s, ok, times
+
+def summarize(times, paths):
+    """
+    Summarize run times in ns by their median, quartiles and IQR in seconds,
+    and the median throughput in S-graph paths per second.
+    """
+    q1, median, q3 = statistics.quantiles(times, n=4, method='inclusive') if len(times) > 1 else times * 3
+    return {
+        'runs': len(times),
+        'median': median / 1e9,
+        'q1': q1 / 1e9,
+        'q3': q3 / 1e9,
+        'iqr': (q3 - q1) / 1e9,
+        'min': min(times) / 1e9,
+        'paths-per-s': paths * 1e9 / median if median else None,
+    }
+
+def bench_case(shape, seed, solvers, anno_num=None, networkx=False, bound=None, build_jobs=1, repeats=1,
+               warmup=0):
+    """
+    Generate a topology of `shape` from `seed`, route it towards a stub AS
+    chosen from the same seed, build its S-graph and run each solver on it.
+    Return a record of the sizes and the time of each phase in seconds.
+    With a RibBound, the RIBs are bounded during the simulation. The
+    S-graph is built by `build_jobs` worker processes. Each solver is run
+    `warmup` times, then `repeats` times, its time being the median run and
+    the summary of the runs being kept in record['runs'].
+    """
+    dg = gao_rexford_topology(seed=seed, **shape)
+    dst = random.Random(seed).choice(dg.tiers[-1])
+    record = dict(shape)
+    record.update({'seed': seed, 'dst': dst, 'nodes': len(dg), 'edges': dg.number_of_edges() // 2})
+    inst = Instrument()
+    reset_dst(dg, dst)
+    bgp_stats = dict()
+    with inst.span('bgp'):
+        succ = bgp_sim(dg, anno_num=anno_num, stats=bgp_stats, bound=bound)
+    record.update(bgp_stats)
+    record['converged'] = bool(succ)
+    if succ:
+        with inst.span('build'):
+            pcg = CompactSGraph()
+            pcg.load(dg)
+            pcg.build(jobs=build_jobs)
+        record['paths'] = pcg.number_of_nodes()
+        record['sgraph-edges'] = pcg.number_of_edges()
+        if networkx:
+            with inst.span('build-nx'):
+                sg = SGraph()
+                sg.load(dg)
+                sg.build()
+        record['solver'] = dict()
+        record['runs'] = dict()
+        for name, solver in solvers.items():
+            s, ok, times = time_solver(solver, pcg, repeats, warmup)
+            record['solver'][name.lower()] = 'SUCCESS' if ok else 'FAILED'
+            record['runs'][name.lower()] = summarize(times, record['paths'])
+            if isinstance(solver, ExactSGraphSolver):
+                record['optimal'] = solver.optimal
+    record['time'] = {name: phase['time-ns'] / 1e9 for name, phase in inst.phases.items()}
+    for name, runs in record.get('runs', {}).items():
+        record['time']['solve-' + name] = runs['median']
+    return record
+
+def bench(shapes, seeds, solvers, anno_num=None, networkx=False, bound=None, build_jobs=1, repeats=1, warmup=0):
+    """
+    Run bench_case() for each shape and seed, yielding the records.
+    """
+    for shape in shapes:
+        for seed in seeds:
+            yield bench_case(shape, seed, solvers, anno_num=anno_num, networkx=networkx, bound=bound,
+                             build_jobs=build_jobs, repeats=repeats, warmup=warmup)
+
+def instance_key(record):
+    """
+    Identify the instance of a record by its shape and seed.
+    """
+    return '%d-%d-%d-%d:%d-%g-%d' % (record['n'], record['depth'], record['tier1'], record['providers'][0],
+                                     record['providers'][1], record['peering'], record['seed'])
+
+def compare(baseline, records, threshold=0.1, noise=1e-4):
+    """
+    Compare the solver runs of `records` with those of the same instances
+    in `baseline`. A solver regressed on an instance if its median time
+    grew by more than `threshold` relative to the baseline and by more than
+    `noise` seconds, and its first quartile is above the third quartile of
+    the baseline; it improved in the symmetric case. Instances whose
+    S-graph changed are not compared. Yield {'instance', 'solver', 'base',
+    'new', 'change', 'verdict'} rows.
+    """
+    base = {instance_key(r): r for r in baseline}
+    for record in records:
+        key = instance_key(record)
+        old = base.get(key)
+        if old is None:
+            continue
+        for name, runs in record.get('runs', {}).items():
+            old_runs = old.get('runs', {}).get(name)
+            if old_runs is None:
+                continue
+            row = {'instance': key, 'solver': name, 'base': old_runs['median'], 'new': runs['median']}
+            row['change'] = runs['median'] / old_runs['median'] - 1 if old_runs['median'] else None
+            delta = runs['median'] - old_runs['median']
+            if (old.get('paths'), old.get('sgraph-edges')) != (record.get('paths'), record.get('sgraph-edges')):
+                row['verdict'] = 'changed-instance'
+            elif row['change'] is not None and row['change'] > threshold and delta > noise and \
+                    runs['q1'] > old_runs['q3']:
+                row['verdict'] = 'regression'
+            elif row['change'] is not None and -row['change'] > threshold / (1 + threshold) and -delta > noise and \
+                    runs['q3'] < old_runs['q1']:
+                row['verdict'] = 'improvement'
+            else:
+                row['verdict'] = 'same'
+            yield row
+
+def format_record(record, phases):
+    row = ['%6d %5d %4d %5.2f %4d' % (record['n'], record['depth'], record['providers'][1],
+                                      record['peering'], record['seed']),
+           '%7d %8s %9s' % (record['edges'], record.get('paths', '-'), record.get('sgraph-edges', '-'))]
+    row += ['%10.4f' % record['time'][p] if p in record['time'] else '%10s' % '-' for p in phases]
+    return ' '.join(row)
+
+def getArgs():
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark the simulator, S-graph builder and solvers '
+                                                 'on generated topologies of growing size.')
+    parser.add_argument('--sizes', default='10,20,40,80,160',
+                        help='comma separated numbers of ASes')
+    parser.add_argument('--depth', default='3', help='comma separated numbers of tiers')
+    parser.add_argument('--tier1', default='4', help='comma separated numbers of tier-1 ASes')
+    parser.add_argument('--providers', default='2',
+                        help='comma separated maximum numbers of providers per AS')
+    parser.add_argument('--peering', default='0.05', help='comma separated peering probabilities')
+    parser.add_argument('--seeds', type=int, default=3, help='number of seeds per shape')
+    parser.add_argument('--anno-num', type=int, default=None,
+                        help='stop the BGP simulation after this many announcements')
+    parser.add_argument('--top-k', type=int, default=None,
+                        help='only keep the k most preferred paths of each AS while simulating BGP')
+    parser.add_argument('--slack', type=int, default=None,
+                        help='only keep the paths of each AS at most this many hops longer than its shortest')
+    parser.add_argument('--networkx', action='store_true',
+                        help='also time building the networkx SGraph')
+    parser.add_argument('--exact-budget', type=float, default=60,
+                        help='time budget of the exact solver in seconds')
+    parser.add_argument('--build-jobs', type=int, default=1,
+                        help='number of worker processes building each S-graph of at least %d paths'
+                             % PARALLEL_MIN_PATHS)
+    parser.add_argument('--repeats', type=int, default=1, help='timed runs of each solver per instance')
+    parser.add_argument('--warmup', type=int, default=0, help='untimed runs of each solver before the timed ones')
+    parser.add_argument('--json', default=None,
+                        help='write the records to this JSON file, which can serve as a baseline')
+    parser.add_argument('--baseline', default=None,
+                        help='compare the solver runs with the records of this JSON file, and exit '
+                             'with status 1 if a solver regressed')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative growth of a median time counted as a regression')
+    parser.add_argument('--noise', type=float, default=1e-4,
+                        help='absolute growth of a median time in seconds below which it is not counted')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = getArgs()
+    solvers = {
+        'Greedy': GreedySolver(),
+        'Greedy+': GreedyPlusSolver(),
+        'Greedy++': GreedyPPGraphSolver(),
+        'Exact': ExactSGraphSolver(time_budget=args.exact_budget)
+    }
+    ints = lambda s: [int(v) for v in s.split(',')]
+    cases = shapes(ints(args.sizes), ints(args.depth), ints(args.tier1),
+                   [(1, p) for p in ints(args.providers)], [float(v) for v in args.peering.split(',')])
+    phases = ['bgp', 'build'] + (['build-nx'] if args.networkx else [])
+    phases += ['solve-' + name.lower() for name in solvers]
+    print('%6s %5s %4s %5s %4s %7s %8s %9s ' % ('ases', 'depth', 'prov', 'peer', 'seed',
+                                                 'edges', 'paths', 's-edges')
+          + ' '.join('%10s' % p.replace('solve-', '') for p in phases))
+    records = []
+    bound = None
+    if args.top_k is not None or args.slack is not None:
+        bound = RibBound(top_k=args.top_k, slack=args.slack)
+    for record in bench(cases, range(args.seeds), solvers, anno_num=args.anno_num, networkx=args.networkx,
+                        bound=bound, build_jobs=args.build_jobs, repeats=args.repeats, warmup=args.warmup):
+        print(format_record(record, phases), flush=True)
+        records.append(record)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(records, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows = list(compare(baseline, records, args.threshold, args.noise))
+        print()
+        print('%-24s %10s %10s %10s %8s  %s' % ('instance', 'solver', 'base', 'new', 'change', 'verdict'))
+        for row in rows:
+            change = '%+7.1f%%' % (100 * row['change']) if row['change'] is not None else '%8s' % '-'
+            print('%-24s %10s %10.6f %10.6f %s  %s' % (row['instance'], row['solver'], row['base'], row['new'],
+                                                       change, row['verdict']))
+        if any(row['verdict'] == 'regression' for row in rows):
+            sys.exit(1)
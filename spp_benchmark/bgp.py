@@ -1,26 +1,141 @@
 #!/usr/bin/env python3
-import networkx as nx
+from array import array
+from collections import deque
 
-def advertise(G, curr, nhop, p):
-    if G._node[nhop]['as'].import_filter(p):
-        G._node[nhop]['as'].unannounced_rib.append(p)
-        return True
+class RibBound(object):
+    """
+    Bound on the RIB of every AS while simulating BGP: keep its `top_k` most
+    preferred paths, within `slack` hops of its shortest one.
+    """
+
+    def __init__(self, top_k=None, slack=None):
+        self.top_k = top_k
+        self.slack = slack
+        self.evicted = 0
+        self.withdrawn = 0
+        self.dead = 0
+
+    def admit(self, G, asys, pid):
+        """
+        Bound the RIB of `asys` after path `pid` was added to it, and return
+        whether `pid` was kept.
+        """
+        rib = asys.permitted_path_ids()
+        if self.slack is None and (self.top_k is None or len(rib) <= self.top_k):
+            return True
+        tree = asys.path_tree
+        evict = []
+        if self.slack is not None:
+            limit = min(tree.length[p] for p in rib) + self.slack
+            evict = [p for p in rib if tree.length[p] > limit]
+            if evict:
+                rib = [p for p in rib if tree.length[p] <= limit]
+        if self.top_k is not None and len(rib) > self.top_k:
+            evict += sorted(rib, key=asys.path_score_id, reverse=True)[self.top_k:]
+        for p in evict:
+            self.evicted += 1
+            self.dead += 1
+            asys.withdraw_path_id(p)
+            self.withdraw(G, p)
+        return pid not in evict
+
+    def withdraw(self, G, pid):
+        """
+        Withdraw the paths extending path `pid` from the RIBs of their ASes.
+        """
+        withdrawn = len(withdraw_extensions(G, pid))
+        self.withdrawn += withdrawn
+        self.dead += withdrawn
+
+    def reclaim(self, G):
+        """
+        Drop the dead paths from the path tree of G once they are more than
+        its live ones.
+        """
+        if 2 * self.dead > len(G.path_tree):
+            compact_path_tree(G)
+            self.dead = 0
+
+def compact_path_tree(G):
+    """
+    Drop the paths of the path tree of G which are in no RIB, renumbering
+    the paths left in the RIBs in place.
+    """
+    ases = [G._node[n]['as'] for n in G.nodes()]
+    new = G.path_tree.compact(sorted(p for asys in ases for p in asys.permitted_path_ids()))
+    for asys in ases:
+        for rib in (asys.announced_rib, asys.unannounced_rib):
+            rib[:] = array('i', (new[p] for p in rib))
+        asys._ranked = None
+
+def withdraw_extensions(G, pid):
+    """
+    Withdraw the paths extending path `pid` from the RIBs of their ASes and
+    return their ids. The RIBs hold the prefixes of their paths, so the
+    extensions of a path in no RIB are skipped.
+    """
+    tree = G.path_tree
+    withdrawn = []
+    stack = [tree.child[pid]]
+    while stack:
+        p = stack.pop()
+        while p >= 0:
+            if G._node[tree.last[p]]['as'].withdraw_path_id(p):
+                withdrawn.append(p)
+                stack.append(tree.child[p])
+            p = tree.sibling[p]
+    return withdrawn
+
+def live_paths(G, bound=None):
+    """
+    Return the number of paths in the RIBs of G, which is the size of its
+    path tree less the dead paths of the RibBound `bound`, if any.
+    """
+    return len(G.path_tree) - (0 if bound is None else bound.dead)
+
+def advertise(G, curr, nhop, pid, bound=None):
+    """
+    Advertise path `pid` of the path tree from AS curr to nhop, which
+    stores the extended path in its unannounced RIB if it accepts it and
+    the RibBound `bound`, if any, keeps it.
+    """
+    asys = G._node[nhop]['as']
+    if asys.import_filter_id(pid):
+        cid = asys.path_tree.add(pid, nhop)
+        asys.unannounced_rib.append(cid)
+        return bound is None or bound.admit(G, asys, cid)
     return False
 
-def bgp_advertise(G, anno_cnt=0, anno_num=None):
+def announce(G, n, pid, bound=None):
+    """
+    Advertise path `pid` of AS n to its neighbors and move it to the
+    announced RIB. Return the neighbors which imported it and whether the
+    last advertisement exported was received.
+    """
+    asys = G._node[n]['as']
+    receivers = []
+    received = False
+    for d in G.neighbors(n):
+        if asys.export_filter_id(pid, d):
+            received = advertise(G, n, d, pid, bound)
+            if received:
+                receivers.append(d)
+    asys.announced_rib.append(pid)
+    return receivers, received
+
+def bgp_advertise(G, anno_cnt=0, anno_num=None, budget=None, bound=None):
     new_anno_cnt = anno_cnt
     stop = False
     for n in G.nodes():
         unannounced_rib = G._node[n]['as'].unannounced_rib
-        announced_rib = G._node[n]['as'].announced_rib
         while unannounced_rib:
-            p = unannounced_rib.pop()
-            received = False
-            for d in G.neighbors(n):
-                pp = p + (d,)
-                if G._node[n]['as'].export_filter(pp):
-                    received = advertise(G, n, d, pp)
-            announced_rib.append(p)
+            pid = unannounced_rib.pop()
+            _, received = announce(G, n, pid, bound)
+            if bound is not None:
+                bound.reclaim(G)
+            if budget is not None and budget.check(paths=live_paths(G, bound)):
+                stop = True
+                break
             if received:
                 new_anno_cnt += 1
                 if (anno_num is not None) and (new_anno_cnt >= anno_num):
@@ -30,16 +145,94 @@ def bgp_advertise(G, anno_cnt=0, anno_num=None):
             break
     return new_anno_cnt, stop, (anno_cnt == new_anno_cnt)
 
-def bgp_sim(G, iter_num=None, anno_num=None, verbose=False):
+def bgp_propagate(G, anno_cnt=0, anno_num=None, stats=None, budget=None, bound=None):
+    """
+    Announce pending paths from a worklist of ASes, visiting only ASes which
+    have something in their unannounced RIB, until no announcement is left
+    or `budget` is exceeded. The number of AS visits is put into `stats` if
+    given.
+    """
+    queue = deque(n for n in G.nodes() if G._node[n]['as'].unannounced_rib)
+    queued = set(queue)
+    new_anno_cnt = anno_cnt
+    visits = 0
+    stop = False
+    while queue and not stop:
+        n = queue.popleft()
+        queued.discard(n)
+        visits += 1
+        unannounced_rib = G._node[n]['as'].unannounced_rib
+        while unannounced_rib:
+            pid = unannounced_rib.pop()
+            receivers, received = announce(G, n, pid, bound)
+            for d in receivers:
+                if d not in queued:
+                    queued.add(d)
+                    queue.append(d)
+            if bound is not None:
+                bound.reclaim(G)
+            if budget is not None and budget.check(paths=live_paths(G, bound)):
+                stop = True
+                break
+            if received:
+                new_anno_cnt += 1
+                if (anno_num is not None) and (new_anno_cnt >= anno_num):
+                    stop = True
+                    break
+    if stats is not None:
+        stats['as-visits'] = visits
+    return new_anno_cnt, stop
+
+def bound_stats(bound, stats):
+    if bound is not None:
+        stats['evicted'] = bound.evicted
+        stats['withdrawn'] = bound.withdrawn
+
+def budget_exceeded(G, budget, stats, bound=None):
+    if budget is None or budget.exceeded is None:
+        return False
+    print('[Warn] %s budget exceeded' % budget.exceeded['limit'])
+    if stats is not None:
+        stats['paths'] = live_paths(G, bound)
+        stats['budget-exceeded'] = budget.exceeded
+    return True
+
+def bgp_sim(G, iter_num=None, anno_num=None, verbose=False, stats=None, budget=None, bound=None):
+    """
+    Simulate BGP announcements on G until quiescence, or for `iter_num`
+    rounds, within `budget` and `bound` if any, putting counts into `stats`.
+    """
+    if budget is not None:
+        budget.start()
+    if bound is not None:
+        bound.evicted = bound.withdrawn = bound.dead = 0
     if iter_num is None:
-        iter_num = nx.algorithms.distance_measures.diameter(G)
+        anno_cnt, stop = bgp_propagate(G, anno_num=anno_num, stats=stats, budget=budget, bound=bound)
+        if stats is not None:
+            stats['announcements'] = anno_cnt
+            bound_stats(bound, stats)
+        if budget_exceeded(G, budget, stats, bound):
+            return False
+        if stop:
+            print('[Warn] reach maximum announcement limit')
+            return False
+        if verbose:
+            print('[Debug] permitted path set converged after %d announcements' % anno_cnt)
+        return True
     anno_cnt = 0
     stop = False
     conv = False
     for i in range(iter_num):
         if verbose:
             print('[Debug] round %d' % i)
-        anno_cnt, stop, conv = bgp_advertise(G, anno_cnt=anno_cnt, anno_num=anno_num)
+        anno_cnt, stop, conv = bgp_advertise(G, anno_cnt=anno_cnt, anno_num=anno_num, budget=budget,
+                                             bound=bound)
+        if stats is not None:
+            stats['announcements'] = anno_cnt
+            stats['rounds'] = i + 1
+            bound_stats(bound, stats)
+        if budget_exceeded(G, budget, stats, bound):
+            return False
         if stop:
             print('[Warn] reach maximum announcement limit')
             return False
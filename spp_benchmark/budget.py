@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+
+import time
+
+class Budget(object):
+    """
+    Limits on the paths, S-graph edges and seconds of a test, None being
+    unlimited.
+    """
+
+    def __init__(self, max_paths=None, max_edges=None, max_time=None, interval=1024):
+        self.max_paths = max_paths
+        self.max_edges = max_edges
+        self.max_time = max_time
+        self.interval = interval
+        self.start_time = None
+        self.calls = 0
+        self.exceeded = None
+
+    def start(self):
+        if self.start_time is None:
+            self.start_time = time.perf_counter()
+        return self
+
+    def check(self, paths=None, edges=None, clock=False):
+        """
+        Return True if a limit is exceeded by `paths`, `edges` or the time
+        elapsed since start(), which is read now if `clock` is set.
+        """
+        if self.exceeded is not None:
+            return True
+        if self.max_paths is not None and paths is not None and paths > self.max_paths:
+            self.exceeded = {'limit': 'paths', 'max': self.max_paths, 'value': paths}
+        elif self.max_edges is not None and edges is not None and edges > self.max_edges:
+            self.exceeded = {'limit': 'edges', 'max': self.max_edges, 'value': edges}
+        elif self.max_time is not None:
+            self.calls += 1
+            if clock or self.calls >= self.interval:
+                self.calls = 0
+                elapsed = time.perf_counter() - self.start_time
+                if elapsed > self.max_time:
+                    self.exceeded = {'limit': 'time', 'max': self.max_time, 'value': elapsed}
+        return self.exceeded is not None
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import mmap
+import struct
+
+MAGIC = b'SPPTOPO1'
+ALIGN = 8
+
+def source_stamps(sources):
+    """
+    Identify the content of each source file by its path, size and mtime.
+    """
+    stamps = []
+    for path in sources:
+        if path is None:
+            stamps.append(None)
+        else:
+            st = os.stat(path)
+            stamps.append([os.path.abspath(path), st.st_size, st.st_mtime_ns])
+    return stamps
+
+def column_layout(columns):
+    """
+    Lay array columns out one after the other, each aligned to 8 bytes.
+    Return ({name: [typecode, offset, length]}, total size).
+    """
+    layout = dict()
+    offset = 0
+    for name, col in columns.items():
+        layout[name] = [col.typecode, offset, len(col)]
+        offset += -(-len(col) * col.itemsize // ALIGN) * ALIGN
+    return layout, offset
+
+def view_columns(data, layout, base=0):
+    """
+    Return the columns of `layout` in the buffer `data` from offset `base`
+    as memoryviews, without copying.
+    """
+    data = memoryview(data)
+    columns = dict()
+    for name, (typecode, offset, length) in layout.items():
+        col = data[base+offset:base+offset+length*struct.calcsize(typecode)]
+        columns[name] = col.cast(typecode)
+    return columns
+
+def save_columns(cache_file, sources, columns, meta=None):
+    """
+    Save array columns parsed from `sources` into `cache_file`: the magic,
+    the length of a JSON header, the header, and the raw column data, each
+    column aligned to 8 bytes. The file is replaced atomically.
+    """
+    layout, _ = column_layout(columns)
+    header = json.dumps({
+        'byteorder': sys.byteorder,
+        'sources': source_stamps(sources),
+        'columns': layout,
+        'meta': meta or dict(),
+    }).encode()
+    header += b' ' * (-(len(MAGIC) + 4 + len(header)) % ALIGN)
+    tmp_file = '%s.%d.tmp' % (cache_file, os.getpid())
+    try:
+        with open(tmp_file, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<I', len(header)))
+            f.write(header)
+            for col in columns.values():
+                data = col.tobytes()
+                f.write(data)
+                f.write(bytes(-len(data) % ALIGN))
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        return False
+    return True
+
+def load_columns(cache_file, sources):
+    """
+    Map the columns of `cache_file` as read-only memoryviews, or return None
+    if there is no valid cache for the current content of `sources`.
+    Return (columns, meta).
+    """
+    try:
+        with open(cache_file, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        if mm[:len(MAGIC)] != MAGIC:
+            return None
+        size, = struct.unpack_from('<I', mm, len(MAGIC))
+        base = len(MAGIC) + 4
+        header = json.loads(mm[base:base+size].decode())
+        if header['byteorder'] != sys.byteorder or header['sources'] != source_stamps(sources):
+            return None
+    except (OSError, ValueError, KeyError, struct.error):
+        return None
+    return view_columns(mm, header['columns'], base + size), header['meta']
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import random
+from array import array
+import networkx
+
+from spp_benchmark.model import CustomerProviderAS
+from spp_benchmark.reader import add_as_rel
+
+def tier_sizes(n, depth, tier1, growth):
+    """
+    Split n ASes into `depth` tiers: `tier1` ASes on top, and the others
+    over the lower tiers with sizes growing by a factor of `growth`.
+    """
+    tier1 = max(1, min(tier1, n))
+    if depth <= 1 or n == tier1:
+        return [n]
+    m = n - tier1
+    weights = [growth ** i for i in range(depth - 1)]
+    sizes = [int(m * w / sum(weights)) for w in weights]
+    sizes[-1] += m - sum(sizes)
+    return [tier1] + [s for s in sizes if s > 0]
+
+def gao_rexford_arrays(n, seed=None, depth=3, tier1=4, providers=(1, 2), peering=0.05, growth=3):
+    """
+    Generate the (src, dst, rel) arrays of a valley-free AS hierarchy, in
+    the format of parse_as_rel(), and the ASNs of each tier.
+    """
+    rng = random.Random(seed)
+    tiers = []
+    asn = 1
+    for size in tier_sizes(n, depth, tier1, growth):
+        tiers.append(list(range(asn, asn + size)))
+        asn += size
+    src = array('q')
+    dst = array('q')
+    rel = array('b')
+    top = tiers[0]
+    for i, a in enumerate(top):
+        for b in top[i+1:]:
+            src.append(a)
+            dst.append(b)
+            rel.append(0)
+    for level in range(1, len(tiers)):
+        for a in tiers[level]:
+            chosen = set()
+            for _ in range(rng.randint(*providers)):
+                if level == 1 or rng.random() < 0.8:
+                    chosen.add(rng.choice(tiers[level-1]))
+                else:
+                    chosen.add(rng.choice(tiers[rng.randrange(level - 1)]))
+            for p in sorted(chosen):
+                src.append(p)
+                dst.append(a)
+                rel.append(-1)
+        tier = tiers[level]
+        pairs = len(tier) * (len(tier) - 1) // 2
+        links = set()
+        for _ in range(min(pairs, int(round(peering * pairs)))):
+            while True:
+                a, b = sorted(rng.sample(tier, 2))
+                if (a, b) not in links:
+                    break
+            links.add((a, b))
+            src.append(a)
+            dst.append(b)
+            rel.append(0)
+    return src, dst, rel, tiers
+
+def gao_rexford_topology(n, seed=None, depth=3, tier1=4, providers=(1, 2), peering=0.05, growth=3):
+    """
+    Generate a valley-free customer/provider/peer hierarchy of n ASes,
+    numbered from 1, with the structure of TopologyReader.dg. The `tier1`
+    ASes of the top tier peer with each other. The other ASes are split
+    over `depth` - 1 lower tiers growing by `growth`, and each of them buys
+    transit from a number of providers in the inclusive range `providers`,
+    mostly from the tier right above it. Two ASes of a lower tier peer with
+    probability `peering`. The result only depends on the arguments.
+    """
+    src, dst, rel, tiers = gao_rexford_arrays(n, seed, depth, tier1, providers, peering, growth)
+    dg = networkx.DiGraph()
+    dg.dst = None
+    add_as_rel(dg, src, dst, rel)
+    for tier in tiers:
+        for asn in tier:
+            if asn not in dg:
+                dg.add_node(asn, **{'as': CustomerProviderAS(asn)})
+    dg.tiers = tiers
+    return dg
+
+def write_dataset(as_rel_file, src, dst, rel, as_country_file=None, country='XX'):
+    """
+    Write generated arrays as a CAIDA as-rel file and, if given, a country
+    file putting all ASes into `country`, for TopologyReader.read_topo().
+    """
+    with open(as_rel_file, 'w') as f:
+        f.write('# generated valley-free topology\n')
+        for src_asn, dst_asn, rel_type in zip(src, dst, rel):
+            f.write('%d|%d|%d\n' % (src_asn, dst_asn, rel_type))
+    if as_country_file:
+        nodes = sorted(set(src) | set(dst))
+        with open(as_country_file, 'w') as f:
+            for asn in nodes:
+                f.write('%d|%s\n' % (asn, country))
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Generate a valley-free AS topology as CAIDA datasets.')
+    parser.add_argument('n', type=int)
+    parser.add_argument('as_rel')
+    parser.add_argument('--as-country', default=None)
+    parser.add_argument('--country', default='XX')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--tier1', type=int, default=4)
+    parser.add_argument('--providers', type=int, nargs=2, default=(1, 2))
+    parser.add_argument('--peering', type=float, default=0.05)
+    parser.add_argument('--growth', type=float, default=3)
+    args = parser.parse_args()
+    src, dst, rel, _ = gao_rexford_arrays(args.n, args.seed, args.depth, args.tier1,
+                                          tuple(args.providers), args.peering, args.growth)
+    write_dataset(args.as_rel, src, dst, rel, args.as_country, args.country)
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+
+from spp_benchmark.bgp import advertise, bgp_propagate, withdraw_extensions, compact_path_tree
+from spp_benchmark.sgraph import SGraph, GreedySolver, ranked_paths, conflict_edges, \
+    TYPE_PREFERENCE, TYPE_CONFLICT_I, TYPE_CONFLICT_II
+from spp_benchmark.verify import StabilityVerifier
+
+def link(topo, a, b, rel):
+    """
+    Add the link between ASes a and b of topo, with the CAIDA relationship
+    `rel`: -1 if a is a provider of b and 0 if they are peers.
+    """
+    if a not in topo or b not in topo:
+        raise ValueError('unknown AS %s' % (b if a in topo else a))
+    if topo.has_edge(a, b):
+        raise ValueError('ASes %s and %s are already linked' % (a, b))
+    as_a, as_b = topo._node[a]['as'], topo._node[b]['as']
+    if not rel:
+        topo.add_edge(a, b, relationship='pp')
+        topo.add_edge(b, a, relationship='pp')
+        as_a.peers.add(b)
+        as_b.peers.add(a)
+    else:
+        topo.add_edge(a, b, relationship='pc')
+        topo.add_edge(b, a, relationship='cp')
+        as_a.customers.add(b)
+        as_b.providers.add(a)
+
+def unlink(topo, a, b):
+    """
+    Remove the link between ASes a and b of topo.
+    """
+    if not topo.has_edge(a, b):
+        raise ValueError('ASes %s and %s are not linked' % (a, b))
+    topo.remove_edge(a, b)
+    topo.remove_edge(b, a)
+    for u, v in ((a, b), (b, a)):
+        asys = topo._node[u]['as']
+        for neighbors in (asys.customers, asys.providers, asys.peers):
+            neighbors.discard(v)
+
+def link_paths(topo, a, b):
+    """
+    Return the ids of the permitted paths crossing the link between ASes a
+    and b as their last hop.
+    """
+    tree = topo.path_tree
+    pids = []
+    for u, v in ((a, b), (b, a)):
+        for pid in topo._node[v]['as'].permitted_path_ids():
+            if pid and tree.last[tree.parent[pid]] == u:
+                pids.append(pid)
+    return pids
+
+def permitted_path_sets(topo):
+    """
+    Map each AS of topo to the set of its permitted path tuples.
+    """
+    tree = topo.path_tree
+    return {n: set(tree.path(pid) for pid in topo._node[n]['as'].permitted_path_ids()) for n in topo.nodes()}
+
+def withdraw_paths(topo, pids):
+    """
+    Withdraw paths `pids` and the paths extending them from the RIBs, and
+    return the ids of the withdrawn paths.
+    """
+    tree = topo.path_tree
+    withdrawn = []
+    for pid in pids:
+        if topo._node[tree.last[pid]]['as'].withdraw_path_id(pid):
+            withdrawn.append(pid)
+            withdrawn.extend(withdraw_extensions(topo, pid))
+    return withdrawn
+
+def warm_assignment(verifier, solution):
+    """
+    Return the part of the path assignment `solution` which stays stable
+    whatever the other ASes are assigned, as {asn: path tree id}: the
+    paths which are permitted, consistent and stable in the instance of
+    `verifier`, whose prefixes are kept, and whose AS has no more preferred
+    path through an AS which is not kept.
+    """
+    tree = verifier.tree
+    parent, last = tree.parent, tree.last
+    chosen, violations = verifier.assign(solution)
+    verifier.check(chosen, violations)
+    kept = {asn: pid for asn, pid in chosen.items() if asn not in violations}
+    changed = True
+    while changed:
+        changed = False
+        for asn, pid in list(kept.items()):
+            if not pid:
+                continue
+            better = verifier.ranked[asn][:verifier.rank[pid]]
+            if kept.get(last[parent[pid]]) != parent[pid] or \
+                    any(last[parent[q]] not in kept for q in better):
+                del kept[asn]
+                changed = True
+    return kept
+
+class IncrementalSPP(object):
+    """
+    SPP instance of topo and its S-graph, kept up to date as links are added
+    and removed.
+    """
+
+    def __init__(self, topo):
+        self.topo = topo
+        bgp_propagate(topo)
+        self.sgraph = SGraph()
+        self.sgraph.load(topo)
+        self.sgraph.build()
+        self.solution = None
+        self.dead = 0
+
+    def remove_link(self, a, b):
+        """
+        Remove the link between ASes a and b, and return the ids of the
+        withdrawn paths. Raise ValueError if they are not linked.
+        """
+        if not self.topo.has_edge(a, b):
+            raise ValueError('ASes %s and %s are not linked' % (a, b))
+        self._reclaim()
+        ranked = ranked_paths(self.topo)
+        withdrawn = withdraw_paths(self.topo, link_paths(self.topo, a, b))
+        unlink(self.topo, a, b)
+        self._remove_paths(withdrawn, ranked)
+        self.dead += len(withdrawn)
+        return withdrawn
+
+    def add_link(self, a, b, rel):
+        """
+        Add the link between ASes a and b with the CAIDA relationship `rel`,
+        and return the ids of the new permitted paths. Raise ValueError if
+        they are already linked.
+        """
+        topo = self.topo
+        link(topo, a, b, rel)
+        self._reclaim()
+        tree = topo.path_tree
+        start = len(tree)
+        for u, v in ((a, b), (b, a)):
+            asys = topo._node[u]['as']
+            for pid in asys.announced_rib:
+                if asys.export_filter_id(pid, v):
+                    advertise(topo, u, v, pid)
+        bgp_propagate(topo)
+        added = list(range(start, len(tree)))
+        self._add_paths(added)
+        return added
+
+    def _reclaim(self):
+        """
+        Drop the withdrawn paths from the path tree once they are more than
+        the live ones.
+        """
+        if 2 * self.dead > len(self.topo.path_tree):
+            compact_path_tree(self.topo)
+            self.dead = 0
+
+    def _remove_paths(self, withdrawn, ranked):
+        """
+        Remove the nodes of the `withdrawn` paths, and the type II edges due
+        to withdrawn paths extending a remaining one, ranked as in `ranked`
+        before the withdrawal.
+        """
+        tree, g = self.topo.path_tree, self.sgraph
+        gone = set(withdrawn)
+        for pp in withdrawn:
+            p = tree.parent[pp]
+            if p in gone:
+                continue
+            v = tree.path(p)
+            for cp in ranked[tree.last[pp]]:
+                if cp == pp:
+                    break
+                if cp not in gone:
+                    u = tree.path(cp)
+                    for k, d in g[u][v].items():
+                        if d['type'] == TYPE_CONFLICT_II:
+                            g.remove_edge(u, v, k)
+                            break
+        g.remove_nodes_from(tree.path(pp) for pp in withdrawn)
+
+    def _add_paths(self, added):
+        """
+        Add the nodes of the `added` paths and their edges. Each conflict is
+        added from the side of the extending path, so that the edges of the
+        pairs of new paths are added once.
+        """
+        tree, g = self.topo.path_tree, self.sgraph
+        ranked = ranked_paths(self.topo)
+        new = set(added)
+        paths = {pid: tree.path(pid) for pid in added}
+        for pid in added:
+            g.add_node(paths[pid])
+
+        def path(pid):
+            if pid not in paths:
+                paths[pid] = tree.path(pid)
+            return paths[pid]
+
+        def add_edge(u, v, t):
+            g.add_edge(path(u), path(v), type=t)
+
+        by_as = dict()
+        for n in added:
+            by_as.setdefault(tree.last[n], []).append(n)
+            for p in tree.ancestors(n):
+                for u, v, t in conflict_edges(tree, p, n, ranked):
+                    add_edge(u, v, t)
+        live = bytearray(len(tree))
+        for as_paths in ranked.values():
+            for pid in as_paths:
+                live[pid] = 1
+        for asn, ns in by_as.items():
+            as_paths = ranked[asn]
+            rank = {pid: i for i, pid in enumerate(as_paths)}
+            old = [pid for pid in as_paths if pid not in new]
+            for n in ns:
+                for q in as_paths:
+                    if q == n or (q in new and q > n):
+                        continue
+                    if rank[n] < rank[q]:
+                        add_edge(q, n, TYPE_PREFERENCE)
+                    else:
+                        add_edge(n, q, TYPE_PREFERENCE)
+            for p in old:
+                for pp in tree.descendants(p):
+                    if live[pp] and pp not in new:
+                        for n in ns:
+                            add_edge(pp, n, TYPE_CONFLICT_I)
+                if p:
+                    for n in ns:
+                        if rank[n] < rank[p]:
+                            add_edge(n, tree.parent[p], TYPE_CONFLICT_II)
+
+    def solve(self):
+        """
+        Solve the instance with GreedySolver, started from the part of the
+        previous solution which is still stable. Return (solution, succ,
+        number of ASes kept from the previous solution).
+        """
+        initial = None
+        if self.solution is not None:
+            initial = warm_assignment(StabilityVerifier(self.topo), self.solution)
+        s, succ, _ = GreedySolver(initial=initial).solve(self.sgraph)
+        self.solution = s
+        return s, succ, len(initial or ())
+
+    def fail_links(self, links):
+        """
+        Fail each link of `links`, given as (a, b, rel), one at a time:
+        remove it, solve, and add it back. Yield (a, b, withdrawn path
+        number, solution, succ, number of ASes kept).
+        """
+        for a, b, rel in links:
+            withdrawn = self.remove_link(a, b)
+            s, succ, kept = self.solve()
+            yield a, b, len(withdrawn), s, succ, kept
+            self.add_link(a, b, rel)
+
+if __name__ == '__main__':
+    import random
+    from spp_benchmark.generator import gao_rexford_topology
+    from spp_benchmark.reader import reset_dst
+    topo = gao_rexford_topology(200, seed=0)
+    reset_dst(topo, random.Random(0).choice(topo.tiers[-1]))
+    inst = IncrementalSPP(topo)
+    inst.solve()
+    links = [(a, b, -1 if d['relationship'] == 'pc' else 0) for a, b, d in topo.edges(data=True)
+             if d['relationship'] == 'pc' or (d['relationship'] == 'pp' and a < b)]
+    for a, b, withdrawn, s, succ, kept in inst.fail_links(links[:20]):
+        print(a, b, withdrawn, len(s), succ, kept)
+    # adding, removing and adding a link again gives the RIBs of a new simulation
+    import copy
+    from spp_benchmark.bgp import bgp_sim
+    a, b, rel = links[0]
+    inst.remove_link(a, b)
+    inst.add_link(a, b, rel)
+    inst.remove_link(a, b)
+    inst.add_link(a, b, rel)
+    fresh = copy.deepcopy(topo)
+    reset_dst(fresh, topo.dst)
+    bgp_sim(fresh)
+    print('RIBs as simulated:', permitted_path_sets(fresh) == permitted_path_sets(topo))
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import json
+import time
+import pstats
+import cProfile
+import resource
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+def reset_peak_rss():
+    """
+    Reset the peak RSS of the current process, if the kernel allows it.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def rss_kb():
+    """
+    Return (current RSS, peak RSS) of the current process in kB.
+    """
+    rss = hwm = None
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    rss = int(line.split()[1])
+                elif line.startswith('VmHWM:'):
+                    hwm = int(line.split()[1])
+    except OSError:
+        pass
+    if hwm is None:
+        hwm = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss, hwm
+
+def profile_top(profile, top):
+    stats = pstats.Stats(profile).stats
+    rows = sorted(stats.items(), key=lambda s: s[1][3], reverse=True)[:top]
+    return [{'function': '%s:%d(%s)' % func, 'ncalls': nc, 'tottime': tt, 'cumtime': ct}
+            for func, (_, nc, tt, ct, _) in rows]
+
+class Instrument(object):
+    """
+    Measure the time and memory of the phases of a test run, and keep named
+    counters.
+    """
+
+    enabled = True
+
+    def __init__(self, memory=False, profile=False, profile_top=20, json_file=None):
+        self.memory = memory
+        self.profile = profile
+        self.profile_top = profile_top
+        self.json_file = json_file
+        self.phases = dict()
+        self.counters = dict()
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def span(self, name):
+        phase = dict()
+        reset = reset_peak_rss()
+        if self.memory:
+            tracemalloc.reset_peak()
+        if self.profile:
+            prof = cProfile.Profile()
+            prof.enable()
+        start = time.perf_counter_ns()
+        try:
+            yield phase
+        finally:
+            phase['time-ns'] = time.perf_counter_ns() - start
+            if self.profile:
+                prof.disable()
+                phase['profile'] = profile_top(prof, self.profile_top)
+            phase['rss-kb'], phase['peak-rss-kb'] = rss_kb()
+            phase['peak-rss-reset'] = reset
+            if self.memory:
+                phase['traced-bytes'], phase['traced-peak-bytes'] = tracemalloc.get_traced_memory()
+            self.phases[name] = phase
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        self.counters[name] = value
+
+    def report(self):
+        return {'phases': self.phases, 'counters': self.counters}
+
+    def emit(self, **fields):
+        """
+        Append the report with `fields` to the JSON lines file, if any.
+        """
+        if self.json_file is None:
+            return
+        record = dict(fields)
+        record.update(self.report())
+        with open(self.json_file, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+class NullInstrument(object):
+    """
+    Disabled Instrument, whose methods do nothing.
+    """
+
+    enabled = False
+
+    def span(self, name):
+        return nullcontext(dict())
+
+    def count(self, name, value=1):
+        pass
+
+    def set(self, name, value):
+        pass
+
+    def report(self):
+        return None
+
+    def emit(self, **fields):
+        pass
+
+NULL_INSTRUMENT = NullInstrument()
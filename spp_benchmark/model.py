@@ -1,16 +1,172 @@
 #!/usr/bin/env python3
 
+from array import array
+
+class PathTree(object):
+    """
+    Shared tree of permitted paths towards one destination, path 0 being
+    (dst,).
+    """
+
+    def __init__(self, dst):
+        self.dst = dst
+        self.parent = array('i', [-1])
+        self.last = array('q', [dst])
+        self.length = array('H', [1])
+        self.signature = array('Q', [1 << (dst & 63)])
+        self.child = array('i', [-1])
+        self.sibling = array('i', [-1])
+
+    def __len__(self):
+        return len(self.parent)
+
+    def add(self, pid, asn):
+        """
+        Add the path extending path `pid` by `asn` and return its id.
+        """
+        cid = len(self.parent)
+        self.parent.append(pid)
+        self.last.append(asn)
+        self.length.append(self.length[pid] + 1)
+        self.signature.append(self.signature[pid] | (1 << (asn & 63)))
+        self.child.append(-1)
+        self.sibling.append(self.child[pid])
+        self.child[pid] = cid
+        return cid
+
+    def find(self, pid, asn):
+        """
+        Return the id of the path extending `pid` by `asn`, or -1.
+        """
+        cid = self.child[pid]
+        while cid >= 0 and self.last[cid] != asn:
+            cid = self.sibling[cid]
+        return cid
+
+    def contains(self, pid, asn):
+        """
+        Check if `asn` is on path `pid`.
+        """
+        if not (self.signature[pid] >> (asn & 63)) & 1:
+            return False
+        while pid >= 0:
+            if self.last[pid] == asn:
+                return True
+            pid = self.parent[pid]
+        return False
+
+    def hop(self, pid, k):
+        """
+        Return p[-k] of path `pid`, or None if the path is shorter than k.
+        """
+        for _ in range(k - 1):
+            pid = self.parent[pid]
+            if pid < 0:
+                return None
+        return self.last[pid]
+
+    def ancestors(self, pid):
+        """
+        Iterate the ids of the proper prefixes of path `pid`.
+        """
+        pid = self.parent[pid]
+        while pid >= 0:
+            yield pid
+            pid = self.parent[pid]
+
+    def descendants(self, pid):
+        """
+        Iterate the ids of the paths which path `pid` is a proper prefix of.
+        """
+        stack = [self.child[pid]]
+        while stack:
+            cid = stack.pop()
+            while cid >= 0:
+                yield cid
+                if self.child[cid] >= 0:
+                    stack.append(self.child[cid])
+                cid = self.sibling[cid]
+
+    def path(self, pid):
+        """
+        Materialize path `pid` as a tuple of ASNs.
+        """
+        p = []
+        while pid >= 0:
+            p.append(self.last[pid])
+            pid = self.parent[pid]
+        p.reverse()
+        return tuple(p)
+
+    def compact(self, pids):
+        """
+        Drop all paths but `pids`, which must be sorted and hold the root
+        path and the prefixes of each of its paths, and renumber them in
+        this order, so that parents still come before their extensions.
+        Return the array mapping the old ids to the new ones, -1 if dropped.
+        """
+        new = array('i', [-1]) * len(self.parent)
+        for i, p in enumerate(pids):
+            new[p] = i
+        self.parent = array('i', (new[self.parent[p]] if p else -1 for p in pids))
+        self.last = array('q', (self.last[p] for p in pids))
+        self.length = array('H', (self.length[p] for p in pids))
+        self.signature = array('Q', (self.signature[p] for p in pids))
+        self.child = array('i', [-1]) * len(pids)
+        self.sibling = array('i', [-1]) * len(pids)
+        for i in range(1, len(pids)):
+            self.sibling[i] = self.child[self.parent[i]]
+            self.child[self.parent[i]] = i
+        return new
+
 class AutonomousSystem(object):
+    """
+    AS with the RIB of its permitted paths towards `dst`.
+    """
+
+    __slots__ = ('asn', 'dst', 'path_tree', 'announced_rib', 'unannounced_rib',
+                 'custom_local_pref', '_ranked', '_ranked_key')
 
     def __init__(self, asn, dst):
         self.asn = asn
         self.dst = dst
-        self.announced_rib = []
-        self.unannounced_rib = []
-        self.custom_local_pref = lambda p: None
-    
+        self.path_tree = None
+        self.announced_rib = array('i')
+        self.unannounced_rib = array('i')
+        self.custom_local_pref = None
+        self._ranked = None
+        self._ranked_key = None
+
     def set_local_pref(self, pref):
         self.custom_local_pref = pref
+        self._ranked = None
+
+    def clear_rib(self):
+        self.announced_rib = array('i')
+        self.unannounced_rib = array('i')
+        self._ranked = None
+
+    def restrict(self, nodes):
+        """
+        Return a new AS with the same policy and no RIB, which only knows
+        its neighbors in `nodes`.
+        """
+        asys = self.__class__(self.asn, self.dst)
+        asys.custom_local_pref = self.custom_local_pref
+        return asys
+
+    def withdraw_path_id(self, pid):
+        """
+        Remove path `pid` from the RIB, if it is there.
+        """
+        for rib in (self.unannounced_rib, self.announced_rib):
+            try:
+                rib.remove(pid)
+            except ValueError:
+                continue
+            self._ranked = None
+            return True
+        return False
 
     def import_filter(self, p):
         if type(p) not in [list, tuple]:
@@ -36,32 +192,87 @@ class AutonomousSystem(object):
             return False
         return True
 
-    def permitted_paths(self):
+    def import_filter_id(self, pid):
+        """
+        Import filter for path `pid` of the path tree extended by this AS.
+        """
+        return not self.path_tree.contains(pid, self.asn)
+
+    def export_filter_id(self, pid, nhop):
+        """
+        Export filter for path `pid` of the path tree extended by `nhop`.
+        """
+        return self.path_tree.last[pid] == self.asn
+
+    def permitted_path_ids(self):
         return self.announced_rib + self.unannounced_rib
 
+    def permitted_paths(self):
+        return [self.path_tree.path(pid) for pid in self.permitted_path_ids()]
+
     def default_local_pref(self, p):
         return 100
-    
+
+    def default_local_pref_id(self, pid):
+        return 100
+
     def local_pref(self, p):
-        c_local_pref = self.custom_local_pref(p)
+        c_local_pref = self.custom_local_pref(p) if self.custom_local_pref else None
         if c_local_pref is None:
             return self.default_local_pref(p)
         return c_local_pref
 
+    def local_pref_id(self, pid):
+        if self.custom_local_pref:
+            c_local_pref = self.custom_local_pref(self.path_tree.path(pid))
+            if c_local_pref is not None:
+                return c_local_pref
+        return self.default_local_pref_id(pid)
+
     def path_score(self, p):
-        return (self.local_pref(p), -len(p), p[-2] if len(p) > 2 else 0)
+        return (self.local_pref(p), -len(p), p[-2] if len(p) > 2 else 0, tuple(p))
+
+    def path_score_id(self, pid):
+        """
+        Score path `pid` like path_score(), the path itself breaking the
+        remaining ties so that the ranking does not depend on the order
+        the paths were imported in.
+        """
+        tree = self.path_tree
+        length = tree.length[pid]
+        return (self.local_pref_id(pid), -length, tree.hop(pid, 2) if length > 2 else 0, tree.path(pid))
+
+    def ranked_permitted_path_ids(self):
+        """
+        Return the cached list of permitted path ids, most preferred first.
+        The list is shared and must not be modified.
+        """
+        key = (len(self.announced_rib), len(self.unannounced_rib))
+        if self._ranked is None or self._ranked_key != key:
+            self._ranked = sorted(self.permitted_path_ids(), key=self.path_score_id, reverse=True)
+            self._ranked_key = key
+        return self._ranked
 
     def ranked_permitted_paths(self):
-        return sorted(self.permitted_paths(), key=lambda p: self.path_score(p), reverse=True)
+        return [self.path_tree.path(pid) for pid in self.ranked_permitted_path_ids()]
 
 
 class CustomerProviderAS(AutonomousSystem):
 
-    def __init__(self, asn, dst=None, customers=set(), providers=set(), peers=set()):
+    __slots__ = ('customers', 'providers', 'peers')
+
+    def __init__(self, asn, dst=None, customers=None, providers=None, peers=None):
         AutonomousSystem.__init__(self, asn, dst)
-        self.customers = customers
-        self.providers = providers
-        self.peers = peers
+        self.customers = set(customers or ())
+        self.providers = set(providers or ())
+        self.peers = set(peers or ())
+
+    def restrict(self, nodes):
+        asys = AutonomousSystem.restrict(self, nodes)
+        asys.customers = set(n for n in self.customers if n in nodes)
+        asys.providers = set(n for n in self.providers if n in nodes)
+        asys.peers = set(n for n in self.peers if n in nodes)
+        return asys
 
     def default_local_pref(self, p):
         if len(p) > 2 and p[-2] in self.customers:
@@ -69,9 +280,24 @@ class CustomerProviderAS(AutonomousSystem):
         else:
             return 100
 
+    def default_local_pref_id(self, pid):
+        tree = self.path_tree
+        if tree.length[pid] > 2 and tree.hop(pid, 2) in self.customers:
+            return 150
+        else:
+            return 100
+
     def export_filter(self, p):
         if not AutonomousSystem.export_filter(self, p):
             return False
         if len(p) > 2 and p[-3] not in self.customers and p[-1] not in self.customers:
             return False
         return True
+
+    def export_filter_id(self, pid, nhop):
+        if not AutonomousSystem.export_filter_id(self, pid, nhop):
+            return False
+        tree = self.path_tree
+        if tree.length[pid] > 1 and tree.hop(pid, 2) not in self.customers and nhop not in self.customers:
+            return False
+        return True
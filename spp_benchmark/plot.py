@@ -5,18 +5,31 @@ import pickle
 
 import matplotlib.pyplot as plt
 
+from spp_benchmark.store import STORE_FILE, open_store
+
 plt.rcParams['text.usetex'] = True
 
-def load_result(dirname):
+def load_result(dirname, where=None):
+    """
+    Load the summaries of the results in the store of `dirname`, without
+    their solutions, or unpickle the results of a directory of pickles.
+    """
+    if os.path.exists(os.path.join(dirname, STORE_FILE)):
+        store = open_store(dirname)
+        results = store.load_results(where=where)
+        store.close()
+        return results
     results = []
     for fname in os.listdir(dirname):
+        if not fname.endswith('.pickle'):
+            continue
         with open(os.path.join(dirname, fname), 'rb') as fd:
             result = pickle.load(fd)
             results.append(result)
     return results
 
 def prune_trival_result(results):
-    return [r for r in results if r['s-graph']['edges'] > 0]
+    return [r for r in results if 's-graph' in r and r['s-graph']['edges'] > 0]
 
 def topo_dist(results):
     nodes_dist = dict()
@@ -26,6 +39,10 @@ def topo_dist(results):
     return nodes_dist
 
 def plot_result(results):
+    # stats-only results have no solver runs
+    results = [r for r in results if r.get('solver')]
+    if not results:
+        return
     fig, ax = plt.subplots(figsize=(8, 5))
 
     g_succ = []
@@ -140,7 +157,7 @@ def plot_dist(dist, bins=100000, log=False, xlabel=None, ylabel='CDF', save=None
 
 if __name__ == '__main__':
     import sys
-    results = load_result(sys.argv[1])
+    results = load_result(sys.argv[1], where='sgraph_edges > 0')
     results = prune_trival_result(results)
     plot_result(results)
     plot_topo_dist(results)
@@ -1,24 +1,239 @@
 #!/usr/bin/env python3
 
-from copy import deepcopy
+from array import array
+import bz2
+import gzip
 import random
 import networkx
 
-from spp_benchmark.model import CustomerProviderAS
+from spp_benchmark.model import CustomerProviderAS, PathTree
+from spp_benchmark.cache import load_columns, save_columns
+
+def open_dataset(filepath):
+    """
+    Open a text dataset, decompressing .bz2 and .gz files on the fly.
+    """
+    if filepath.endswith('.bz2'):
+        return bz2.open(filepath, 'rt')
+    if filepath.endswith('.gz'):
+        return gzip.open(filepath, 'rt')
+    return open(filepath, 'r')
+
+def parse_as_rel(filepath):
+    """
+    Stream a CAIDA as-rel file into (src, dst, rel) arrays, where rel is -1
+    if src is a provider of dst and 0 if they are peers.
+    """
+    src = array('q')
+    dst = array('q')
+    rel = array('b')
+    with open_dataset(filepath) as as_rel:
+        for line in as_rel:
+            if line.startswith('#') or not line.strip():
+                continue
+            fields = line.rstrip('\n').split('|')
+            src.append(int(fields[0]))
+            dst.append(int(fields[1]))
+            rel.append(int(fields[2]))
+    return src, dst, rel
+
+def parse_as_type(filepath):
+    """
+    Stream a CAIDA as2types file into (asn, type) arrays, keeping the first
+    letter of each type.
+    """
+    asns = array('q')
+    types = array('B')
+    with open_dataset(filepath) as as_types:
+        for line in as_types:
+            if line.startswith('#') or not line.strip():
+                continue
+            asn, _, as_type = line.rstrip('\n').split('|')
+            asns.append(int(asn))
+            types.append(ord(as_type[0]))
+    return asns, types
+
+def parse_as_country(filepath):
+    """
+    Stream an "asn|country" file into (asn, country index) arrays and the
+    list of country codes.
+    """
+    asns = array('q')
+    codes = array('H')
+    names = []
+    index = dict()
+    with open_dataset(filepath) as as_country:
+        for line in as_country:
+            if line.startswith('#') or not line.strip():
+                continue
+            asn, country = line.rstrip('\n').split('|')
+            if country not in index:
+                index[country] = len(names)
+                names.append(country)
+            asns.append(int(asn))
+            codes.append(index[country])
+    return asns, codes, names
+
+def add_as_rel(dg, src, dst, rel):
+    """
+    Add the AS relationships of the parsed arrays to the graph dg, with a
+    CustomerProviderAS for each new AS.
+    """
+    def edges():
+        for src_asn, dst_asn, rel_type in zip(src, dst, rel):
+            if not rel_type:
+                yield src_asn, dst_asn, {'relationship': 'pp'}
+                yield dst_asn, src_asn, {'relationship': 'pp'}
+            else:
+                yield src_asn, dst_asn, {'relationship': 'pc'}
+                yield dst_asn, src_asn, {'relationship': 'cp'}
+    dg.add_edges_from(edges())
+    nodes = dg._node
+    for n in nodes:
+        if not nodes[n].get('as'):
+            nodes[n]['as'] = CustomerProviderAS(n)
+    for src_asn, dst_asn, rel_type in zip(src, dst, rel):
+        if not rel_type:
+            nodes[src_asn]['as'].peers.add(dst_asn)
+            nodes[dst_asn]['as'].peers.add(src_asn)
+        else:
+            nodes[src_asn]['as'].customers.add(dst_asn)
+            nodes[dst_asn]['as'].providers.add(src_asn)
+
+def set_as_types(dg, asns, types):
+    for asn, as_type in zip(asns, types):
+        if asn in dg._node:
+            dg._node[asn]['type'] = chr(as_type)
+
+def set_as_countries(dg, asns, codes, names, country_list=None):
+    """
+    Set the country of the ASes of dg and, if given, append them to the AS
+    lists of `country_list`.
+    """
+    for asn, code in zip(asns, codes):
+        if asn in dg._node:
+            country = names[code]
+            dg._node[asn]['country'] = country
+            if country_list is not None:
+                country_list.setdefault(country, []).append(asn)
+
+class TopologyIndex(object):
+    """
+    Indexes over the ASes of a topology graph: by country, by AS type, by
+    degree, and its stub networks. AS lists follow the node order of the
+    graph. The largest connected component of each country is computed on
+    first use and kept.
+    """
+
+    def __init__(self, dg):
+        self.dg = dg
+        self.position = dict()
+        self.country = dict()
+        self.type = dict()
+        self.degree = dict()
+        self.stubs = []
+        self.country_lcc = dict()
+        for i, n in enumerate(dg.nodes()):
+            data = dg._node[n]
+            self.position[n] = i
+            if 'country' in data:
+                self.country.setdefault(data['country'], []).append(n)
+            if 'type' in data:
+                self.type.setdefault(data['type'], []).append(n)
+            self.degree.setdefault(dg.degree(n), []).append(n)
+            if all(e['relationship'] != 'pc' for e in dg._succ[n].values()):
+                self.stubs.append(n)
+
+    def by_degree(self, lb):
+        """
+        Return the ASes with a degree of at least `lb`.
+        """
+        nodes = [n for d, dn in self.degree.items() if d >= lb for n in dn]
+        nodes.sort(key=self.position.__getitem__)
+        return nodes
+
+    def largest_country_component(self, country):
+        if country not in self.country_lcc:
+            self.country_lcc[country] = largest_component(self.dg, self.country.get(country, []))
+        return self.country_lcc[country]
 
 class TopologyReader(object):
 
     def __init__(self):
-        self.dg = networkx.DiGraph()
-        self.dg.dst = None
+        self._dg = networkx.DiGraph()
+        self._dg.dst = None
+        self._index = None
+        self.columns = None
+        self.country_names = []
         self.country_list = dict()
-    
-    def read_topo(self, as_rel_file, as_type_file=None, as_country_file=None):
-        self.read_topo_with_as_rel(as_rel_file)
-        if as_type_file:
-            self.load_as_type(as_type_file)
-        if as_country_file:
-            self.load_as_country(as_country_file)
+
+    @property
+    def dg(self):
+        return self.build_graph()
+
+    @dg.setter
+    def dg(self, dg):
+        self._dg = dg
+        self._index = None
+
+    @property
+    def index(self):
+        """
+        TopologyIndex of the network graph, built on first use.
+        """
+        if self._index is None:
+            self._index = TopologyIndex(self.dg)
+        return self._index
+
+    def read_topo(self, as_rel_file, as_type_file=None, as_country_file=None, cache=True):
+        """
+        Read the CAIDA datasets into array columns, from the binary cache
+        next to `as_rel_file` if it is still valid for all sources. The
+        network graph is only built from the columns on first use.
+        """
+        sources = [as_rel_file, as_type_file, as_country_file]
+        cache_file = as_rel_file + '.cache'
+        loaded = load_columns(cache_file, sources) if cache else None
+        if loaded is None:
+            columns = dict()
+            columns['src'], columns['dst'], columns['rel'] = parse_as_rel(as_rel_file)
+            if as_type_file:
+                columns['type_asn'], columns['type'] = parse_as_type(as_type_file)
+            meta = {'countries': []}
+            if as_country_file:
+                columns['country_asn'], columns['country'], meta['countries'] = parse_as_country(as_country_file)
+            if cache:
+                save_columns(cache_file, sources, columns, meta)
+        else:
+            columns, meta = loaded
+        self.columns = columns
+        self.country_names = meta['countries']
+        self._dg = None
+        self._index = None
+        self.country_list = dict()
+        if 'country' in columns:
+            nodes = set(columns['src'])
+            nodes.update(columns['dst'])
+            for asn, code in zip(columns['country_asn'], columns['country']):
+                if asn in nodes:
+                    self.country_list.setdefault(self.country_names[code], []).append(asn)
+        return self.columns
+
+    def build_graph(self):
+        """
+        Return the network graph, building it from the columns read by
+        read_topo() if it has not been built yet.
+        """
+        if self._dg is None:
+            dg = networkx.DiGraph()
+            dg.dst = None
+            add_as_rel(dg, self.columns['src'], self.columns['dst'], self.columns['rel'])
+            if 'type' in self.columns:
+                set_as_types(dg, self.columns['type_asn'], self.columns['type'])
+            if 'country' in self.columns:
+                set_as_countries(dg, self.columns['country_asn'], self.columns['country'], self.country_names)
+            self._dg = dg
+        return self._dg
 
     def read_topo_with_as_rel(self, filepath, dst=None):
         """
@@ -26,60 +241,26 @@ class TopologyReader(object):
         networkx directed graph.
         """
         self.dg.dst = dst
-        with open(filepath, 'r') as as_rel:
-            for line in as_rel.readlines():
-                if line.startswith('#'):
-                    continue
-                src_as, dst_as, rel = line.strip('\n').split('|')
-                src_asn = int(src_as)
-                dst_asn = int(dst_as)
-                self.dg.add_edge(src_asn, dst_asn)
-                self.dg.add_edge(dst_asn, src_asn)
-                if not self.dg._node[src_asn].get('as'):
-                    self.dg._node[src_asn]['as'] = CustomerProviderAS(src_asn)
-                if not self.dg._node[dst_asn].get('as'):
-                    self.dg._node[dst_asn]['as'] = CustomerProviderAS(dst_asn)
-                rel_type = int(rel)
-                if not rel_type:
-                    self.dg.edges[src_asn, dst_asn]['relationship'] = 'pp'
-                    self.dg._node[src_asn]['as'].peers.add(dst_asn)
-                    self.dg.edges[dst_asn, src_asn]['relationship'] = 'pp'
-                    self.dg._node[dst_asn]['as'].peers.add(src_asn)
-                else:
-                    self.dg.edges[src_asn, dst_asn]['relationship'] = 'pc'
-                    self.dg._node[src_asn]['as'].customers.add(dst_asn)
-                    self.dg.edges[dst_asn, src_asn]['relationship'] = 'cp'
-                    self.dg._node[dst_asn]['as'].providers.add(src_asn)
+        self._index = None
+        add_as_rel(self.dg, *parse_as_rel(filepath))
         if not self.dg.dst and self.dg.dst in self.dg.nodes():
-            self.dg._node[self.dg.dst]['as'].unannounced_rib.append((self.dg.dst,))
+            self.dg.dst = None
+            set_dst(self.dg, dst)
         return self.dg
 
     def load_as_type(self, filepath):
         """
         Read AS types from CAIDA dataset and augment it into the network graph.
         """
-        with open(filepath, 'r') as as_types:
-            for line in as_types.readlines():
-                if line.startswith('#'):
-                    continue
-                asn, _, as_type = line.strip('\n').split('|')
-                asn = int(asn)
-                if asn in self.dg.nodes():
-                    self.dg.nodes[asn]['type'] = as_type[0]
+        set_as_types(self.dg, *parse_as_type(filepath))
+        self._index = None
 
     def load_as_country(self, filepath):
         """
         Read AS countries and augment it into the network graph.
         """
-        with open(filepath, 'r') as as_country:
-            for line in as_country.readlines():
-                asn, country = line.strip('\n').split('|')
-                asn = int(asn)
-                if asn in self.dg.nodes():
-                    self.dg.nodes[asn]['country'] = country
-                    if country not in self.country_list:
-                        self.country_list[country] = []
-                    self.country_list[country].append(asn)
+        set_as_countries(self.dg, *parse_as_country(filepath), country_list=self.country_list)
+        self._index = None
     
     def country_stat(self):
         return sorted([(c, len(al)) for c, al in self.country_list.items()],
@@ -90,30 +271,36 @@ class TopologyReader(object):
             print(c, num)
 
     def read_as_by_country(self, country):
-        return [n for n in self.dg.nodes() if self.dg.nodes[n].get('country', '') == country]
+        return list(self.index.country.get(country, []))
+
+    def read_as_by_type(self, as_type):
+        return list(self.index.type.get(as_type, []))
 
     def get_subtopo_by_country(self, country, maximum=False):
+        if maximum:
+            return safe_subgraph(self.dg, self.index.largest_country_component(country))
         sub_nodes = self.read_as_by_country(country)
         return safe_connected_subgraph(self.dg, sub_nodes, maximum)
     
     def get_subtopo_by_degree(self, deg_threshold, maximum=False):
-        sub_nodes = [n for n in self.dg.nodes() if self.dg.degree(n) >= 2*deg_threshold]
+        sub_nodes = self.index.by_degree(2*deg_threshold)
         return safe_connected_subgraph(self.dg, sub_nodes, maximum)
     
     def get_stub_networks_by_rel(self, dg=None):
-        _dg = dg or self.dg
-        return [n for n in _dg.nodes() if all([_dg.edges[e]['relationship'] != 'pc' for e in _dg.out_edges(n)])]
+        if not dg:
+            return list(self.index.stubs)
+        return [n for n in dg.nodes() if all([dg.edges[e]['relationship'] != 'pc' for e in dg.out_edges(n)])]
 
     def get_random_stub_network(self, dg=None):
-        _dg = dg or self.dg
-        stub_networks = self.get_stub_networks_by_rel(_dg)
+        stub_networks = self.get_stub_networks_by_rel(dg)
         if not stub_networks:
             return None
         return random.choice(stub_networks)
 
 def set_dst(dg, dst):
     """
-    Set destination AS for a graph.
+    Set destination AS for a graph. Permitted paths towards it are kept in
+    a path tree shared by all ASes of the graph, and RIBs hold path ids.
     """
     if 'dst' not in dg.__dir__():
         dg.dst = None
@@ -122,38 +309,66 @@ def set_dst(dg, dst):
     if dst not in dg.nodes():
         return
     dg.dst = dst
+    dg.path_tree = PathTree(dst)
     for n in dg.nodes():
         dg._node[n]['as'].dst = dst
-    dg._node[dg.dst]['as'].unannounced_rib.append((dg.dst,))
+        dg._node[n]['as'].path_tree = dg.path_tree
+    dg._node[dg.dst]['as'].unannounced_rib.append(0)
 
-def safe_connected_subgraph(dg, nodes, maximum=False):
+def reset_dst(dg, dst):
+    """
+    Clear the per-destination state of a graph, i.e., the RIBs and the path
+    tree, and set a new destination AS for it.
+    """
+    dg.dst = None
+    for n in dg.nodes():
+        dg._node[n]['as'].clear_rib()
+    set_dst(dg, dst)
+
+def largest_component(dg, nodes):
+    """
+    Return the node set of the largest connected component of the subgraph
+    of `dg` induced by `nodes`, or an empty set.
+    """
     sdg = dg.subgraph(nodes)
-    sub_nodes = []
+    all_comps = [c for c in networkx.algorithms.components.connected_components(sdg.to_undirected())]
+    return max(all_comps, key=lambda c: len(c)) if len(all_comps) else set()
+
+def safe_connected_subgraph(dg, nodes, maximum=False):
     if maximum:
-        all_comps = [c for c in networkx.algorithms.components.connected_components(sdg.to_undirected())]
-        sub_nodes = max(all_comps, key=lambda c: len(c)) if len(all_comps) else []
+        sub_nodes = largest_component(dg, nodes)
     else:
+        sdg = dg.subgraph(nodes)
         c = random.choice(list(sdg.nodes()))
         sub_nodes = networkx.algorithms.components.node_connected_component(sdg.to_undirected(), c)
     return safe_subgraph(dg, sub_nodes)
 
 def safe_subgraph(dg, nodes):
     """
-    Return a deepcopy of subgraph of `dg` including vertices in `nodes`
-    without redundant information.
+    Return a new graph induced by `nodes` of `dg`, with new AS objects which
+    only know their neighbors in `nodes`. Nodes and edges are added in the
+    order of the subgraph view of dg, and only attribute dicts are copied.
     """
-    sdg = deepcopy(dg.subgraph(nodes))
-    ns = sdg.nodes()
-    for n in sdg.nodes():
-        sdg.nodes[n]['as'].customers.intersection_update(ns)
-        sdg.nodes[n]['as'].providers.intersection_update(ns)
-        sdg.nodes[n]['as'].peers.intersection_update(ns)
+    # the node filter set of a copied subgraph view is rebuilt from its own
+    # iteration order, which keeps the node order of the former deepcopy
+    view = dg.subgraph(set(dg.nbunch_iter(nodes)))
+    ns = view.nodes()
+    sdg = networkx.DiGraph()
+    sdg.dst = None
+    for n, data in view.nodes(data=True):
+        data = dict(data)
+        if 'as' in data:
+            data['as'] = data['as'].restrict(ns)
+        sdg.add_node(n, **data)
+    for u, nbrs in view.adjacency():
+        for v, data in nbrs.items():
+            sdg.add_edge(u, v, **data)
     set_dst(sdg, dg.dst)
     return sdg
 
 def example_topology():
     dg = networkx.DiGraph()
-    dg.dst = 0
+    dg.dst = None
     dg.add_edge(0, 1, relationship='cp')
     dg.add_edge(1, 0, relationship='pc')
     dg.add_edge(0, 2, relationship='cp')
@@ -185,16 +400,16 @@ def example_topology():
     dg.add_edge(6, 7, relationship='cp')
     dg.add_edge(7, 6, relationship='pc')
 
-    dg._node[0]['as'] = CustomerProviderAS(0, dst=0, providers={1, 2, 3})
-    dg._node[1]['as'] = CustomerProviderAS(1, dst=0, customers={0}, providers={2, 3, 4})
-    dg._node[2]['as'] = CustomerProviderAS(2, dst=0, customers={0, 1}, providers={3, 4})
-    dg._node[3]['as'] = CustomerProviderAS(3, dst=0, customers={0, 1, 2, 5, 6}, peers={4, 7})
-    dg._node[4]['as'] = CustomerProviderAS(4, dst=0, customers={1, 2}, peers={3})
-    dg._node[5]['as'] = CustomerProviderAS(5, dst=0, customers={6}, providers={3, 7})
-    dg._node[6]['as'] = CustomerProviderAS(6, dst=0, providers={3, 5, 7})
-    dg._node[7]['as'] = CustomerProviderAS(7, dst=0, customers={5, 6}, peers={3})
+    dg._node[0]['as'] = CustomerProviderAS(0, providers={1, 2, 3})
+    dg._node[1]['as'] = CustomerProviderAS(1, customers={0}, providers={2, 3, 4})
+    dg._node[2]['as'] = CustomerProviderAS(2, customers={0, 1}, providers={3, 4})
+    dg._node[3]['as'] = CustomerProviderAS(3, customers={0, 1, 2, 5, 6}, peers={4, 7})
+    dg._node[4]['as'] = CustomerProviderAS(4, customers={1, 2}, peers={3})
+    dg._node[5]['as'] = CustomerProviderAS(5, customers={6}, providers={3, 7})
+    dg._node[6]['as'] = CustomerProviderAS(6, providers={3, 5, 7})
+    dg._node[7]['as'] = CustomerProviderAS(7, customers={5, 6}, peers={3})
 
-    dg._node[dg.dst]['as'].unannounced_rib.append((dg.dst,))
+    set_dst(dg, 0)
     return dg
 
 def example_pcg():
@@ -1,12 +1,20 @@
 #!/usr/bin/env python3
 
+import sys
 import time
+import heapq
+import multiprocessing
+from array import array
 import networkx
 
 TYPE_PREFERENCE = 0
 TYPE_CONFLICT_I = 1
 TYPE_CONFLICT_II = 2
 
+# fewer permitted paths are built sequentially, as starting the worker
+# processes would take longer than the build
+PARALLEL_MIN_PATHS = 10000
+
 def prefix_match(path1, path2):
     """
     check if path1 is a prefix of path2
@@ -32,6 +40,171 @@ def consistent_path(p, pset):
         return True
     return False
 
+def ranked_paths(topo):
+    """
+    Map each AS of topo to the path tree ids of its ranked permitted paths.
+    """
+    return {asn: topo._node[asn]['as'].ranked_permitted_path_ids() for asn in topo.nodes()}
+
+def iter_sgraph_edges(tree, ranked):
+    """
+    Iterate (u, v, type) edges of the S-graph over the ranked permitted paths
+    of each AS, given as ids of the path tree.
+    """
+    for as_paths in ranked.values():
+        for i, p in enumerate(as_paths):
+            for pp in as_paths[:i]:
+                yield p, pp, TYPE_PREFERENCE
+    added = bytearray(len(tree))
+    for as_paths in ranked.values():
+        for p in as_paths:
+            for pp in tree.ancestors(p):
+                if added[pp]:
+                    yield from conflict_edges(tree, pp, p, ranked)
+            for pp in tree.descendants(p):
+                if added[pp]:
+                    yield from conflict_edges(tree, p, pp, ranked)
+        for p in as_paths:
+            added[p] = 1
+
+def conflict_edges(tree, p, pp, ranked):
+    """
+    Iterate conflict edges between path p and its extension pp.
+    """
+    for cp in ranked[tree.last[p]]:
+        if cp != p:
+            yield pp, cp, TYPE_CONFLICT_I
+    if tree.parent[pp] == p:
+        for cp in ranked[tree.last[pp]]:
+            if cp == pp:
+                break
+            yield cp, p, TYPE_CONFLICT_II
+
+def as_sgraph_edges(tree, ranked, asn, index):
+    """
+    Iterate the S-graph edges of the paths of AS asn: its preference edges
+    and the conflict edges of its paths with the permitted paths they
+    extend, which are those with `index` >= 0. Over all ASes, these are the
+    edges of iter_sgraph_edges().
+    """
+    as_paths = ranked[asn]
+    for i, p in enumerate(as_paths):
+        for pp in as_paths[:i]:
+            yield p, pp, TYPE_PREFERENCE
+    for pp in as_paths:
+        for p in tree.ancestors(pp):
+            if index[p] >= 0:
+                yield from conflict_edges(tree, p, pp, ranked)
+
+# (tree, ranked, asns, index) of a parallel build, inherited by the workers
+_blocks = None
+
+def sgraph_block(span):
+    """
+    Return the CSR rows (indptr, indices, masks) of the out edges of the
+    paths of the ASes asns[start:stop] of the current parallel build, and
+    their typed edge counts. All out edges of a path are found from its own
+    AS, and the paths of these ASes are the `rows` rows of the S-graph from
+    `row`.
+    """
+    tree, ranked, asns, index = _blocks
+    start, stop, row, rows = span
+    src = array('i')
+    dst = array('i')
+    mask = array('B')
+    counts = [0, 0, 0]
+    for asn in asns[start:stop]:
+        for u, v, t in as_sgraph_edges(tree, ranked, asn, index):
+            src.append(index[u] - row)
+            dst.append(index[v])
+            mask.append(1 << t)
+            counts[t] += 1
+    return csr_adjacency(rows, src, dst, mask) + (counts,)
+
+def parallel_sgraph_blocks(tree, ranked, index, jobs, chunks=8):
+    """
+    Find the S-graph edges with `jobs` forked worker processes, over blocks
+    of ASes holding about the same number of paths, `chunks` blocks per
+    worker. The paths must be numbered by `index` in the order of `ranked`.
+    Yield the result of sgraph_block() for each block in that order.
+    """
+    global _blocks
+    asns = list(ranked)
+    total = sum(len(as_paths) for as_paths in ranked.values())
+    spans = []
+    start = row = paths = 0
+    for i, asn in enumerate(asns):
+        paths += len(ranked[asn])
+        if paths * jobs * chunks >= total * (len(spans) + 1) or i == len(asns) - 1:
+            spans.append((start, i + 1, row, paths - row))
+            start = i + 1
+            row = paths
+    _blocks = (tree, ranked, asns, index)
+    try:
+        ctx = multiprocessing.get_context('fork')
+        with ctx.Pool(jobs) as pool:
+            yield from pool.imap(sgraph_block, spans)
+    finally:
+        _blocks = None
+
+def over_budget(ranked, budget, stats, edges=0):
+    """
+    Check the number of permitted paths against `budget`, which also starts
+    its clock. Once it is exceeded, put the permitted paths, the `edges`
+    built so far and the exceeded limit into `stats`.
+    """
+    if budget is None:
+        return False
+    paths = sum(len(as_paths) for as_paths in ranked.values())
+    if not budget.start().check(paths=paths):
+        return False
+    print('[Warn] %s budget exceeded' % budget.exceeded['limit'])
+    if stats is not None:
+        stats['permitted-path-num'] = paths
+        stats['edges'] = edges
+        stats['budget-exceeded'] = budget.exceeded
+    return True
+
+def degree_histogram(degrees):
+    """
+    Histogram of degrees as sorted [degree, count] pairs.
+    """
+    hist = dict()
+    for d in degrees:
+        hist[d] = hist.get(d, 0) + 1
+    return [[d, hist[d]] for d in sorted(hist)]
+
+def sgraph_stats(topo, budget=None):
+    """
+    Count the paths, typed edges and degrees of the S-graph of topo without
+    building it.
+    """
+    tree = topo.path_tree
+    ranked = ranked_paths(topo)
+    stats = dict()
+    if over_budget(ranked, budget, stats):
+        return stats
+    outdeg = array('q', bytes(8 * len(tree)))
+    indeg = array('q', bytes(8 * len(tree)))
+    counts = [0, 0, 0]
+    for u, v, t in iter_sgraph_edges(tree, ranked):
+        if budget is not None and budget.check(edges=sum(counts) + 1):
+            over_budget(ranked, budget, stats, sum(counts))
+            return stats
+        counts[t] += 1
+        outdeg[u] += 1
+        indeg[v] += 1
+    pids = [pid for as_paths in ranked.values() for pid in as_paths]
+    return {
+        'permitted-path-num': len(pids),
+        'edges': sum(counts),
+        'edges-0': counts[TYPE_PREFERENCE],
+        'edges-1': counts[TYPE_CONFLICT_I],
+        'edges-2': counts[TYPE_CONFLICT_II],
+        'out-degree': degree_histogram(outdeg[pid] for pid in pids),
+        'in-degree': degree_histogram(indeg[pid] for pid in pids),
+    }
+
 class SGraph(networkx.MultiDiGraph):
 
     def __init__(self):
@@ -41,42 +214,225 @@ class SGraph(networkx.MultiDiGraph):
     def load(self, topo):
         self.topo = topo
 
-    def build(self):
+    def build(self, budget=None, stats=None):
+        """
+        Build the S-graph of the loaded topology. With a Budget, stop once it
+        is exceeded, clear the graph, put the partial counts into `stats` and
+        return False.
+        """
         if not self.topo:
-            return
-        all_paths = []
-        for asn in self.topo.nodes():
-            as_paths = []
-            for p in self.topo._node[asn]['as'].ranked_permitted_paths():
-                self.add_node(p)
-                for pp in as_paths:
-                    self.add_edge(p, pp, type=TYPE_PREFERENCE)
-                as_paths.append(p)
-            for p in as_paths:
-                for pp in all_paths:
-                    if prefix_match(pp, p):
-                        for _, cp, t in self.out_edges(pp, data='type'):
-                            if t == TYPE_PREFERENCE:
-                                self.add_edge(p, cp, type=TYPE_CONFLICT_I)
-                        for cp, _, t in self.in_edges(pp, data='type'):
-                            if t == TYPE_PREFERENCE:
-                                self.add_edge(p, cp, type=TYPE_CONFLICT_I)
-                        if pp == p[:-1]:
-                            for _, cp, t in self.out_edges(p, data='type'):
-                                if t == TYPE_PREFERENCE:
-                                    self.add_edge(cp, pp, type=TYPE_CONFLICT_II)
-                    elif prefix_match(p, pp):
-                        for _, cp, t in self.out_edges(p, data='type'):
-                            if t == TYPE_PREFERENCE:
-                                self.add_edge(pp, cp, type=TYPE_CONFLICT_I)
-                        for cp, _, t in self.in_edges(p, data='type'):
-                            if t == TYPE_PREFERENCE:
-                                self.add_edge(pp, cp, type=TYPE_CONFLICT_I)
-                        if p == pp[:-1]:
-                            for _, cp, t in self.out_edges(pp, data='type'):
-                                if t == TYPE_PREFERENCE:
-                                    self.add_edge(cp, p, type=TYPE_CONFLICT_II)
-            all_paths.extend(as_paths)
+            return True
+        tree = self.topo.path_tree
+        ranked = ranked_paths(self.topo)
+        if over_budget(ranked, budget, stats):
+            return False
+        paths = dict()
+        for as_paths in ranked.values():
+            for pid in as_paths:
+                paths[pid] = tree.path(pid)
+                self.add_node(paths[pid])
+        edges = 0
+        for u, v, t in iter_sgraph_edges(tree, ranked):
+            edges += 1
+            if budget is not None and budget.check(edges=edges):
+                self.clear()
+                over_budget(ranked, budget, stats, edges - 1)
+                return False
+            self.add_edge(paths[u], paths[v], type=t)
+        return True
+
+class CompactSGraph(object):
+    """
+    Array-backed S-graph in CSR form, with a bitmask of edge types per edge.
+    """
+
+    def __init__(self):
+        self.topo = None
+        self.pids = array('i')
+        self.indptr = array('q', [0])
+        self.indices = array('i')
+        self.types = array('B')
+        self.rindptr = array('q', [0])
+        self.rindices = array('i')
+        self.rtypes = array('B')
+        self.type_counts = [0, 0, 0]
+
+    def load(self, topo):
+        self.topo = topo
+
+    def build(self, budget=None, stats=None, jobs=1):
+        """
+        Build the S-graph of the loaded topology with `jobs` worker processes,
+        and return False, leaving it empty, if `budget` is exceeded.
+        """
+        if not self.topo:
+            return True
+        tree = self.topo.path_tree
+        ranked = ranked_paths(self.topo)
+        if over_budget(ranked, budget, stats):
+            return False
+        index = array('i', [-1]) * len(tree)
+        for as_paths in ranked.values():
+            for pid in as_paths:
+                index[pid] = len(self.pids)
+                self.pids.append(pid)
+        src = array('i')
+        dst = array('i')
+        mask = array('B')
+
+        def abort(edges):
+            topo = self.topo
+            self.__init__()
+            self.load(topo)
+            over_budget(ranked, budget, stats, edges)
+            return False
+
+        n = len(self.pids)
+        if jobs > 1 and n >= PARALLEL_MIN_PATHS:
+            # blocks are row ranges of the forward CSR arrays, whose merged
+            # (u, v) pairs give the same reverse arrays as the edges
+            blocks = parallel_sgraph_blocks(tree, ranked, index, jobs)
+            for indptr, indices, types, counts in blocks:
+                edges = sum(self.type_counts) + sum(counts)
+                if budget is not None and budget.check(edges=edges, clock=True):
+                    blocks.close()
+                    return abort(sum(self.type_counts))
+                offset = self.indptr[-1]
+                self.indptr.extend(offset + j for j in indptr[1:])
+                self.indices.extend(indices)
+                self.types.extend(types)
+                for t in range(3):
+                    self.type_counts[t] += counts[t]
+            del index
+            for u in range(n):
+                src.extend([u] * (self.indptr[u+1] - self.indptr[u]))
+            self.rindptr, self.rindices, self.rtypes = csr_adjacency(n, self.indices, src, self.types)
+            return True
+        for u, v, t in iter_sgraph_edges(tree, ranked):
+            if budget is not None and budget.check(edges=len(src) + 1):
+                return abort(len(src))
+            src.append(index[u])
+            dst.append(index[v])
+            mask.append(1 << t)
+            self.type_counts[t] += 1
+        del index
+        self.indptr, self.indices, self.types = csr_adjacency(n, src, dst, mask)
+        self.rindptr, self.rindices, self.rtypes = csr_adjacency(n, dst, src, mask)
+        return True
+
+    def __len__(self):
+        return len(self.pids)
+
+    def number_of_nodes(self):
+        return len(self.pids)
+
+    def number_of_edges(self, t=None):
+        """
+        Count typed edges, i.e., the edges of the equivalent multigraph.
+        """
+        if t is None:
+            return sum(self.type_counts)
+        return self.type_counts[t]
+
+    def path(self, u):
+        return self.topo.path_tree.path(self.pids[u])
+
+    def out_edges(self, u):
+        """
+        Iterate (v, mask) for the out edges of path id u.
+        """
+        for j in range(self.indptr[u], self.indptr[u+1]):
+            yield self.indices[j], self.types[j]
+
+    def in_edges(self, u):
+        """
+        Iterate (v, mask) for the in edges of path id u.
+        """
+        for j in range(self.rindptr[u], self.rindptr[u+1]):
+            yield self.rindices[j], self.rtypes[j]
+
+    def successors(self, u):
+        return self.indices[self.indptr[u]:self.indptr[u+1]]
+
+    def predecessors(self, u):
+        return self.rindices[self.rindptr[u]:self.rindptr[u+1]]
+
+    @classmethod
+    def from_sgraph(cls, sgraph):
+        """
+        Convert an SGraph with path tuples as nodes, keeping its node order.
+        """
+        g = cls()
+        g.load(sgraph.topo)
+        tree = sgraph.topo.path_tree
+        index = dict()
+        for p in sgraph.nodes():
+            pid = 0
+            for asn in p[1:]:
+                pid = tree.find(pid, asn)
+            index[p] = len(g.pids)
+            g.pids.append(pid)
+        src = array('i')
+        dst = array('i')
+        mask = array('B')
+        for p, q, t in sgraph.edges(data='type'):
+            src.append(index[p])
+            dst.append(index[q])
+            mask.append(1 << t)
+            g.type_counts[t] += 1
+        del index
+        n = len(g.pids)
+        g.indptr, g.indices, g.types = csr_adjacency(n, src, dst, mask)
+        g.rindptr, g.rindices, g.rtypes = csr_adjacency(n, dst, src, mask)
+        return g
+
+    def to_networkx(self):
+        """
+        Export as an SGraph with path tuples as nodes.
+        """
+        g = SGraph()
+        g.load(self.topo)
+        paths = [self.path(u) for u in range(len(self))]
+        g.add_nodes_from(paths)
+        for u, p in enumerate(paths):
+            for v, m in self.out_edges(u):
+                for t in (TYPE_PREFERENCE, TYPE_CONFLICT_I, TYPE_CONFLICT_II):
+                    if m & (1 << t):
+                        g.add_edge(p, paths[v], type=t)
+        return g
+
+def csr_adjacency(n, src, dst, mask):
+    """
+    Build CSR arrays (indptr, indices, masks) of n nodes from edge arrays,
+    merging the masks of repeated (src, dst) pairs.
+    """
+    count = array('q', bytes(8 * (n + 1)))
+    for u in src:
+        count[u+1] += 1
+    for u in range(n):
+        count[u+1] += count[u]
+    pos = array('q', count)
+    indices = array('i', bytes(4 * len(src)))
+    masks = array('B', bytes(len(src)))
+    for k, u in enumerate(src):
+        j = pos[u]
+        indices[j] = dst[k]
+        masks[j] = mask[k]
+        pos[u] = j + 1
+    del pos
+    indptr = array('q', [0])
+    out_indices = array('i')
+    out_masks = array('B')
+    for u in range(n):
+        row = dict()
+        for j in range(count[u], count[u+1]):
+            v = indices[j]
+            row[v] = row.get(v, 0) | masks[j]
+        for v in sorted(row):
+            out_indices.append(v)
+            out_masks.append(row[v])
+        indptr.append(len(out_indices))
+    return indptr, out_indices, out_masks
 
 class BaseSGraphSolver(object):
 
@@ -106,56 +462,353 @@ class BaseSGraphSolver(object):
         return t
     
     def _start_timer(self):
-        self.timer = time.time()
+        self.timer = time.perf_counter()
         self.timing = True
     
     def _end_timer(self):
         if self.timing:
-            self.timer = time.time() - self.timer
+            self.timer = time.perf_counter() - self.timer
             self.timing = False
 
-class NaiveSGraphSolver(BaseSGraphSolver):
+def bitset_adjacency(sgraph):
+    """
+    Undirected adjacency of a CompactSGraph as one int bitset per path.
+    """
+    n = len(sgraph)
+    adj = []
+    row = bytearray((n + 7) // 8)
+    for u in range(n):
+        nbrs = list(sgraph.successors(u)) + list(sgraph.predecessors(u))
+        for v in nbrs:
+            row[v >> 3] |= 1 << (v & 7)
+        adj.append(int.from_bytes(row, 'little'))
+        for v in nbrs:
+            row[v >> 3] = 0
+    return adj
 
-    def _solve(self, _sgraph):
-        """
-        Find a max independent set.
-        """
-        if isinstance(_sgraph, networkx.Graph):
-            import igraph
-            _pg = networkx.Graph(_sgraph)
-            _g = networkx.relabel.convert_node_labels_to_integers(_pg, label_attribute='path')
-            ig = igraph.Graph(len(_g), list(_g.edges()))
-            mis = ig.largest_independent_vertex_sets()
-            if mis:
-                return [(0,)] + [_g._node[v]['path'] for v in mis[0]]
-        else:
-            return
+class ExactSGraphSolver(BaseSGraphSolver):
+    """
+    Maximum independent set of the S-graph by branch and bound, completed
+    greedily after `time_budget` seconds.
+    """
+
+    def __init__(self, sgraph=None, time_budget=None):
+        BaseSGraphSolver.__init__(self, sgraph)
+        self.time_budget = time_budget
+        self.optimal = None
+
+    def _solve(self, _sgraph, enable_timer=False):
+        if not isinstance(_sgraph, CompactSGraph):
+            _sgraph = CompactSGraph.from_sgraph(_sgraph)
+        n = len(_sgraph)
+        if enable_timer:
+            self._start_timer()
+        deadline = None
+        if self.time_budget is not None:
+            deadline = time.perf_counter() + self.time_budget
+        timed_out = False
+        adj = bitset_adjacency(_sgraph)
+        last, pids = _sgraph.topo.path_tree.last, _sgraph.pids
+        members = dict()
+        for u in range(n):
+            members.setdefault(last[pids[u]], []).append(u)
+        groups = []
+        group = [0] * n
+        for paths in members.values():
+            g = sum(1 << u for u in paths)
+            groups.append(g)
+            for u in paths:
+                group[u] = g
+
+        def bound(cand):
+            return sum(1 for g in groups if g & cand)
+
+        def reduce(cand):
+            chosen = 0
+            changed = True
+            while changed:
+                changed = False
+                x = cand
+                while x:
+                    low = x & -x
+                    x ^= low
+                    if not cand & low:
+                        continue
+                    v = low.bit_length() - 1
+                    nv = adj[v] & cand
+                    if nv & ~group[v]:
+                        if nv.bit_count() > 2:
+                            continue
+                        w = nv & -nv
+                        if nv != w and not adj[w.bit_length() - 1] & nv & ~w:
+                            continue
+                    chosen |= low
+                    cand &= ~(nv | low)
+                    changed = True
+            return chosen, cand
+
+        def components(cand):
+            comps = []
+            while cand:
+                comp = frontier = cand & -cand
+                while frontier:
+                    reach = 0
+                    while frontier:
+                        low = frontier & -frontier
+                        frontier ^= low
+                        reach |= adj[low.bit_length() - 1]
+                    frontier = reach & cand & ~comp
+                    comp |= frontier
+                comps.append(comp)
+                cand &= ~comp
+            return comps
+
+        def greedy(cand):
+            # first independent set of cand, picking paths in order
+            chosen = 0
+            while cand:
+                low = cand & -cand
+                chosen |= low
+                cand &= ~(adj[low.bit_length() - 1] | low)
+            return chosen
+
+        def search(cand, floor):
+            # largest independent set of cand if larger than floor, else None
+            nonlocal timed_out
+            if deadline is not None and not timed_out and time.perf_counter() > deadline:
+                timed_out = True
+            if timed_out:
+                return greedy(cand) if floor < 0 else None
+            if bound(cand) <= floor:
+                return None
+            chosen, cand = reduce(cand)
+            floor -= chosen.bit_count()
+            comps = components(cand)
+            if len(comps) > 1:
+                bounds = [bound(c) for c in comps]
+                rest = sum(bounds)
+                if rest <= floor:
+                    return None
+                found = 0
+                for c, b in zip(comps, bounds):
+                    rest -= b
+                    r = search(c, max(floor - found - rest, -1))
+                    if r is None:
+                        return None
+                    chosen |= r
+                    found += r.bit_count()
+                return chosen
+            best = None
+            if not cand:
+                return chosen if floor < 0 else None
+            top = bound(cand)
+            gm = min((g & cand for g in groups if g & cand), key=int.bit_count)
+            x = gm
+            while x and floor < top:
+                low = x & -x
+                x ^= low
+                v = low.bit_length() - 1
+                r = search(cand & ~adj[v] & ~low, floor - 1)
+                if r is not None:
+                    best = r | low
+                    floor = r.bit_count() + 1
+            if floor < top - 1:
+                r = search(cand & ~gm, floor)
+                if r is not None:
+                    best = r
+            return chosen | best if best is not None else None
+
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, 4 * len(groups) + 1000))
+        try:
+            s = search((1 << n) - 1, -1) or 0
+        finally:
+            sys.setrecursionlimit(limit)
+        self.optimal = not timed_out
+        if enable_timer:
+            self._end_timer()
+        return [_sgraph.path(u) for u in range(n) if s >> u & 1]
 
 class GreedySolver(BaseSGraphSolver):
+    """
+    Assign each AS its most preferred path extending the path of its next
+    hop, starting from the `initial` assignment, if any.
+    """
+
+    def __init__(self, sgraph=None, initial=None):
+        BaseSGraphSolver.__init__(self, sgraph)
+        self.initial = initial
 
     def _solve(self, _sgraph, enable_timer=False):
         if enable_timer:
             self._start_timer()
         _topo = _sgraph.topo
-        P = {v:_topo._node[v]['as'].ranked_permitted_paths() for v in _topo.nodes()}
-        pi = {_topo.dst: (_topo.dst,)}
-        found = True
-        while len(pi) < len(P) and found:
-            found = False
-            for v in P.keys():
-                if v in pi.keys():
-                    continue
-                pv = None
-                for p in P[v]:
-                    if compatible_with_path_assign(p, pi):
-                        pv = p
-                        break
-                if len(pv) > 1 and (pv[-2] in pi.keys()):
-                    pi[v] = pv
-                    found = True
+        tree = _topo.path_tree
+        parent, last = tree.parent, tree.last
+        P = ranked_paths(_topo)
+        pos = {v: i for i, v in enumerate(P)}
+        pi = {_topo.dst: 0}
+        if self.initial:
+            pi.update(self.initial)
+
+        def compatible(pid):
+            a = parent[pid]
+            while last[a] not in pi:
+                a = parent[a]
+            return pi[last[a]] == a
+
+        # (pass, position) of the next evaluation of each AS
+        ready = [(0, pos[v], v) for v in P if v not in pi]
+        queued = set(v for _, _, v in ready)
+        while ready and len(pi) < len(P):
+            t, i, v = heapq.heappop(ready)
+            queued.discard(v)
+            pv = None
+            for p in P[v]:
+                if compatible(p):
+                    pv = p
+                    break
+            if pv is None or last[parent[pv]] not in pi:
+                continue
+            pi[v] = pv
+            for p in P[v]:
+                for c in tree.descendants(p):
+                    w = last[c]
+                    if w not in pi and w not in queued:
+                        queued.add(w)
+                        heapq.heappush(ready, (t if pos[w] > i else t + 1, pos[w], w))
         if enable_timer:
             self._end_timer()
-        return list(pi.values())
+        return [tree.path(pid) for pid in pi.values()]
+
+class GreedyPlusState(object):
+    """
+    Ranked candidate paths of each AS for Greedy+.
+    """
+
+    def __init__(self, _topo):
+        self.tree = _topo.path_tree
+        self.P = ranked_paths(_topo)
+        self.pos = array('i', bytes(4 * len(self.tree)))
+        self.alive = bytearray(len(self.tree))
+        for as_paths in self.P.values():
+            for i, p in enumerate(as_paths):
+                self.pos[p] = i
+                self.alive[p] = 1
+        self.order = {v: i for i, v in enumerate(self.P)}
+        self.head = dict.fromkeys(self.P, 0)
+        self.cut = {v: len(as_paths) for v, as_paths in self.P.items()}
+        self.V = set(self.P)
+        self.V.discard(_topo.dst)
+        self.Vi = [_topo.dst]
+        self.fixed = {_topo.dst}
+        self.pending = []
+        self.ready = []
+        self.waiting = dict()
+
+    def first(self, v):
+        """
+        Return the most preferred alive path of v, or None.
+        """
+        as_paths = self.P[v]
+        i = self.head[v]
+        while i < self.cut[v] and not self.alive[as_paths[i]]:
+            i += 1
+        self.head[v] = i
+        return as_paths[i] if i < self.cut[v] else None
+
+    def touch(self, v):
+        """
+        Queue v once its most preferred path becomes selectable.
+        """
+        p = self.first(v)
+        if p is None or self.tree.hop(p, 2) in self.fixed:
+            heapq.heappush(self.ready, (self.order[v], v))
+        else:
+            self.waiting.setdefault(self.tree.hop(p, 2), []).append(v)
+
+    def kill(self, p):
+        v = self.tree.last[p]
+        head = v in self.V and self.first(v) == p
+        self.alive[p] = 0
+        self.pending.append(p)
+        if head:
+            self.touch(v)
+
+    def truncate(self, u):
+        """
+        Drop the paths of each AS v less preferred than p+(v,), where p is
+        the path fixed for u.
+        """
+        p = self.first(u)
+        if p is None:
+            return
+        pv = self.tree.child[p]
+        while pv >= 0:
+            v = self.tree.last[pv]
+            if self.alive[pv] and v in self.V:
+                self.truncate_after(v, pv)
+            pv = self.tree.sibling[pv]
+
+    def truncate_after(self, v, pv):
+        as_paths = self.P[v]
+        for i in range(self.pos[pv] + 1, self.cut[v]):
+            if self.alive[as_paths[i]]:
+                self.kill(as_paths[i])
+        self.cut[v] = self.pos[pv] + 1
+
+    def filter(self):
+        """
+        Drop the alive paths of unfixed ASes which extend a removed path.
+        """
+        # kill() pushes the paths it drops onto pending
+        pending = self.pending
+        while pending:
+            c = self.tree.child[pending.pop()]
+            while c >= 0:
+                if self.alive[c] and self.tree.last[c] in self.V:
+                    self.kill(c)
+                c = self.tree.sibling[c]
+
+    def filter_all(self):
+        """
+        Drop the alive paths of unfixed ASes with a prefix which is not
+        alive.
+        """
+        # parents are added to the path tree before their extensions
+        parent = self.tree.parent
+        consistent = bytearray(self.alive)
+        for p in range(1, len(self.tree)):
+            if not consistent[parent[p]]:
+                consistent[p] = 0
+        for p in range(1, len(self.tree)):
+            if self.alive[p] and not consistent[p] and self.tree.last[p] in self.V:
+                self.kill(p)
+        self.pending = []
+
+    def select(self):
+        """
+        Fix the first AS, in node order, whose most preferred path is empty
+        or extends a fixed AS. Return it, or None.
+        """
+        while self.ready:
+            _, v = heapq.heappop(self.ready)
+            if v not in self.V:
+                continue
+            p = self.first(v)
+            if p is not None and self.tree.hop(p, 2) not in self.fixed:
+                continue
+            self.V.remove(v)
+            self.Vi.append(v)
+            self.fixed.add(v)
+            for i in range(self.head[v] + 1, self.cut[v]):
+                if self.alive[self.P[v][i]]:
+                    self.kill(self.P[v][i])
+            for u in self.waiting.pop(v, []):
+                if u in self.V:
+                    self.touch(u)
+            return v
+        return None
 
 class GreedyPlusSolver(BaseSGraphSolver):
 
@@ -163,75 +816,120 @@ class GreedyPlusSolver(BaseSGraphSolver):
         if enable_timer:
             self._start_timer()
         _topo = _sgraph.topo
-        P = {v:_topo._node[v]['as'].ranked_permitted_paths() for v in _topo.nodes()}
-        V = list(P.keys())
-        V.remove(_topo.dst)
-        Vi = [_topo.dst]
-        while V:
-            for v in V:
-                for u in Vi:
-                    if len(P[u]) == 1:
-                        p = P[u][0]
-                        try:
-                            idx = P[v].index(p+(v,))
-                            P[v][idx+1:] = []
-                        except ValueError:
-                            pass
-            Pall = sum(P.values(), [])
-            for v in V:
-                Pv = P[v]
-                P[v] = [p for p in Pv if consistent_path(p, Pall)]
-            c = None
-            for v in V:
-                if not P[v] or (len(P[v][0]) > 1 and (P[v][0][-2] in Vi)):
-                    P[v] = P[v][:1]
-                    c = v
-                    break
-            if c:
-                V.remove(c)
-                Vi.append(c)
-            else:
+        state = GreedyPlusState(_topo)
+        c = _topo.dst
+        state.truncate(c)
+        state.filter_all()
+        for v in state.V:
+            state.touch(v)
+        while state.V:
+            c = state.select()
+            if c is None:
                 break
+            state.truncate(c)
+            state.filter()
         if enable_timer:
             self._end_timer()
-        return [P[v][0] for v in Vi if P[v]]
+        tree = _topo.path_tree
+        return [tree.path(state.first(v)) for v in state.Vi if state.first(v) is not None]
 
 class GreedyPPGraphSolver(BaseSGraphSolver):
+    """
+    Greedy independent set of the S-graph, picking paths without out edges
+    or preference edges first, then paths of minimum out degree.
+    """
 
     def _solve(self, _sgraph, enable_timer=False):
-        import itertools
+        if not isinstance(_sgraph, CompactSGraph):
+            _sgraph = CompactSGraph.from_sgraph(_sgraph)
         asnum = len(_sgraph.topo.nodes())
-        s = []
-        g = _sgraph.copy()
+        indptr, indices, types = _sgraph.indptr, _sgraph.indices, _sgraph.types
+        rindptr, rindices, rtypes = _sgraph.rindptr, _sgraph.rindices, _sgraph.rtypes
+        weight = [bin(m).count('1') for m in range(8)]
+        pref = 1 << TYPE_PREFERENCE
+        # per-mask lookup tables to sum rows of masks with bytes.translate
+        weight_table = bytes(weight) + bytes(248)
+        pref_table = bytes(m & pref for m in range(256))
+        n = len(_sgraph)
         if enable_timer:
             self._start_timer()
-        while len(s) < asnum and len(g.nodes()) > 0:
-            # nodes with zero out degree
-            b = [n for n in g.nodes() if g.out_degree(n) == 0]
-            if not b:
-                # nodes with no preference edge
-                b = [n for n in g.nodes()
-                     if all([e[2] != TYPE_PREFERENCE for e in g.out_edges(n, data='type')])
-                     and all([e[2] != TYPE_PREFERENCE for e in g.in_edges(n, data='type')])]
-            if not b:
-                # nodes with lowest out degree
-                b = min([(k[0], [n[0] for n in k[1]])
-                         for k in itertools.groupby(dict(g.out_degree()).items(),
-                                                    key=lambda d: d[1])],
-                        key=lambda d: d[0])[1]
-            # g_old = g
-            # g = g_old.copy()
-            # avoid graph copy to reduce memory
-            neighs = dict()
-            for n in b:
-                neighs[n] = list(g.successors(n)) + list(g.predecessors(n))
-            for n in b:
-                # neighs = g_old.neighbors(n)
-                g.remove_nodes_from(neighs[n]+[n])
-            s.extend(b)
+        alive = bytearray(b'\x01') * n
+        outdeg = array('q', bytes(8 * n))
+        prefdeg = array('q', bytes(8 * n))
+        for u in range(n):
+            row = types[indptr[u]:indptr[u+1]].tobytes()
+            rrow = rtypes[rindptr[u]:rindptr[u+1]].tobytes()
+            outdeg[u] = sum(row.translate(weight_table))
+            prefdeg[u] = sum(row.translate(pref_table)) + sum(rrow.translate(pref_table))
+        buckets = [set() for _ in range(max(outdeg, default=0) + 1)]
+        for u in range(n):
+            buckets[outdeg[u]].add(u)
+        heaps = [None] * len(buckets)
+        nopref = set(u for u in range(n) if not prefdeg[u])
+        lo = 0
+        remaining = n
+
+        def remove(v):
+            nonlocal lo, remaining
+            alive[v] = 0
+            remaining -= 1
+            buckets[outdeg[v]].discard(v)
+            nopref.discard(v)
+            for j in range(rindptr[v], rindptr[v+1]):
+                u = rindices[j]
+                if alive[u]:
+                    m = rtypes[j]
+                    buckets[outdeg[u]].discard(u)
+                    outdeg[u] -= weight[m]
+                    buckets[outdeg[u]].add(u)
+                    if heaps[outdeg[u]] is not None:
+                        heapq.heappush(heaps[outdeg[u]], u)
+                    if outdeg[u] < lo:
+                        lo = outdeg[u]
+                    if m & pref:
+                        prefdeg[u] -= 1
+                        if not prefdeg[u]:
+                            nopref.add(u)
+            for j in range(indptr[v], indptr[v+1]):
+                w = indices[j]
+                if alive[w] and types[j] & pref:
+                    prefdeg[w] -= 1
+                    if not prefdeg[w]:
+                        nopref.add(w)
+
+        s = []
+        while len(s) < asnum and remaining > 0:
+            if buckets[0]:
+                # paths with zero out degree
+                b = buckets[0]
+            elif nopref:
+                # paths with no preference edge
+                b = nopref
+            else:
+                # first path with lowest out degree
+                while not buckets[lo]:
+                    lo += 1
+                heap = heaps[lo]
+                if heap is None:
+                    heap = heaps[lo] = list(buckets[lo])
+                    heapq.heapify(heap)
+                while not alive[heap[0]] or outdeg[heap[0]] != lo:
+                    heapq.heappop(heap)
+                b = [heap[0]]
+            for u in sorted(b):
+                if not alive[u]:
+                    continue
+                s.append(u)
+                remove(u)
+                for j in range(indptr[u], indptr[u+1]):
+                    if alive[indices[j]]:
+                        remove(indices[j])
+                for j in range(rindptr[u], rindptr[u+1]):
+                    if alive[rindices[j]]:
+                        remove(rindices[j])
         if enable_timer:
             self._end_timer()
-        return s
+        return [_sgraph.path(u) for u in s]
 
 if __name__ == '__main__':
     from spp_benchmark.reader import example_topology
@@ -253,3 +951,6 @@ if __name__ == '__main__':
     greedypp_solver = GreedyPPGraphSolver(sgraph)
     s = greedypp_solver.solve()
     print(s)
+    exact_solver = ExactSGraphSolver(sgraph)
+    s = exact_solver.solve()
+    print(s)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+from array import array
+from multiprocessing import shared_memory
+import networkx
+
+from spp_benchmark.model import CustomerProviderAS
+from spp_benchmark.reader import set_dst
+from spp_benchmark.cache import column_layout, view_columns
+
+RELATIONSHIPS = ('pp', 'pc', 'cp')
+
+def attach_memory(name):
+    """
+    Attach to the shared memory block `name`, leaving its cleanup to the
+    process which created it.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # before Python 3.13, the block is registered again with the
+        # resource tracker shared with the creator, which is a no-op
+        return shared_memory.SharedMemory(name=name)
+
+class SharedTopology(object):
+    """
+    Read-only AS topology in shared memory for worker processes. The
+    creator must unlink() it when done.
+    """
+
+    def __init__(self, shm, layout, meta, owner=False):
+        self.shm = shm
+        self.layout = layout
+        self.meta = meta
+        self.owner = owner
+        self.columns = view_columns(shm.buf, layout)
+        self._position = None
+
+    @classmethod
+    def create(cls, topo_reader, countries=()):
+        """
+        Put the graph of `topo_reader` and the largest connected components
+        of `countries` into a new shared memory block.
+        """
+        dg = topo_reader.dg
+        columns = {
+            'asn': array('q'),
+            'country': array('h'),
+            'type': array('B'),
+            'indptr': array('q', [0]),
+            'indices': array('i'),
+            'rel': array('b'),
+            'component-ptr': array('q', [0]),
+            'component': array('i'),
+        }
+        position = {n: i for i, n in enumerate(dg.nodes())}
+        codes = dict()
+        for n in dg.nodes():
+            data = dg._node[n]
+            columns['asn'].append(n)
+            country = data.get('country')
+            columns['country'].append(-1 if country is None else codes.setdefault(country, len(codes)))
+            columns['type'].append(ord(data['type']) if 'type' in data else 0)
+            for v, e in dg._succ[n].items():
+                columns['indices'].append(position[v])
+                columns['rel'].append(RELATIONSHIPS.index(e['relationship']))
+            columns['indptr'].append(len(columns['indices']))
+        for cc in countries:
+            component = topo_reader.index.largest_country_component(cc)
+            columns['component'].extend(position[n] for n in component)
+            columns['component-ptr'].append(len(columns['component']))
+        layout, size = column_layout(columns)
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        meta = {'countries': list(codes), 'components': list(countries)}
+        shared = cls(shm, layout, meta, owner=True)
+        for name, col in columns.items():
+            shared.columns[name][:] = col
+        return shared
+
+    def __getstate__(self):
+        return {'name': self.shm.name, 'layout': self.layout, 'meta': self.meta}
+
+    def __setstate__(self, state):
+        self.__init__(attach_memory(state['name']), state['layout'], state['meta'])
+
+    def __del__(self):
+        self.close()
+
+    def __len__(self):
+        return len(self.columns['asn'])
+
+    @property
+    def position(self):
+        """
+        Map each ASN to its row in the columns, built on first use.
+        """
+        if self._position is None:
+            self._position = {n: i for i, n in enumerate(self.columns['asn'])}
+        return self._position
+
+    def get_subtopo_by_country(self, country, maximum=True):
+        """
+        Return the subgraph of the largest connected component of
+        `country`, which must be one of the countries of create().
+        """
+        if not maximum:
+            raise ValueError('only the largest component of a country is shared')
+        i = self.meta['components'].index(country)
+        ptr, component, asn = self.columns['component-ptr'], self.columns['component'], self.columns['asn']
+        return self.subgraph(set(asn[j] for j in component[ptr[i]:ptr[i+1]]))
+
+    def subgraph(self, nodes):
+        """
+        Return a new graph induced by `nodes`, with new AS objects which only
+        know their neighbors in `nodes`, like safe_subgraph() on the graph.
+        """
+        cols = self.columns
+        asn, indptr, indices, rel = cols['asn'], cols['indptr'], cols['indices'], cols['rel']
+        position = self.position
+        nodes = set(n for n in nodes if n in position)
+        # iterate in the order of a networkx subgraph view of the graph
+        if 2 * len(nodes) < len(asn):
+            order = list(nodes)
+        else:
+            order = [n for n in asn if n in nodes]
+        sdg = networkx.DiGraph()
+        sdg.dst = None
+        edges = []
+        for n in order:
+            i = position[n]
+            asys = CustomerProviderAS(n)
+            for j in range(indptr[i], indptr[i+1]):
+                v = asn[indices[j]]
+                if v not in nodes:
+                    continue
+                relationship = RELATIONSHIPS[rel[j]]
+                edges.append((n, v, relationship))
+                if relationship == 'pc':
+                    asys.customers.add(v)
+                elif relationship == 'cp':
+                    asys.providers.add(v)
+                else:
+                    asys.peers.add(v)
+            data = {'as': asys}
+            if cols['type'][i]:
+                data['type'] = chr(cols['type'][i])
+            if cols['country'][i] >= 0:
+                data['country'] = self.meta['countries'][cols['country'][i]]
+            sdg.add_node(n, **data)
+        for u, v, relationship in edges:
+            sdg.add_edge(u, v, relationship=relationship)
+        set_dst(sdg, None)
+        return sdg
+
+    def close(self):
+        """
+        Release the columns and detach from the shared memory block.
+        """
+        if getattr(self, 'columns', None) is not None:
+            for col in self.columns.values():
+                col.release()
+            self.columns = None
+            self.shm.close()
+
+    def unlink(self):
+        """
+        Detach from the shared memory block and free it, if created here.
+        """
+        self.close()
+        if self.owner:
+            self.shm.unlink()
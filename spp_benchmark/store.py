@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import zlib
+import pickle
+import sqlite3
+
+STORE_FILE = 'results.db'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    country TEXT,
+    dst INTEGER,
+    status TEXT,
+    nodes INTEGER,
+    edges INTEGER,
+    paths INTEGER,
+    sgraph_edges INTEGER,
+    sgraph_edges_0 INTEGER,
+    sgraph_edges_1 INTEGER,
+    sgraph_edges_2 INTEGER,
+    extra TEXT,
+    created REAL
+);
+CREATE TABLE IF NOT EXISTS solvers (
+    run_id INTEGER REFERENCES runs(id),
+    solver TEXT,
+    status TEXT,
+    time REAL,
+    size INTEGER,
+    PRIMARY KEY (run_id, solver)
+);
+CREATE TABLE IF NOT EXISTS solutions (
+    run_id INTEGER REFERENCES runs(id),
+    solver TEXT,
+    payload BLOB,
+    PRIMARY KEY (run_id, solver)
+);
+CREATE INDEX IF NOT EXISTS runs_country ON runs (country, dst);
+'''
+
+SGRAPH_COLUMNS = [
+    ('permitted-path-num', 'paths'),
+    ('edges', 'sgraph_edges'),
+    ('edges-0', 'sgraph_edges_0'),
+    ('edges-1', 'sgraph_edges_1'),
+    ('edges-2', 'sgraph_edges_2'),
+]
+
+RUN_KEYS = {'id', 'country', 'dst', 'status', 'nodes', 'edges', 's-graph', 'solver'}
+
+class ResultStore(object):
+    """
+    SQLite store of test results. Summary metrics of each run and solver are
+    kept in columns, while solution paths are compressed into a separate
+    table and only loaded on request. Each process opens its own connection,
+    so forked workers can append to the same store concurrently.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._pid = None
+
+    @property
+    def conn(self):
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=60)
+            self._pid = os.getpid()
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+    def append(self, result):
+        """
+        Append a result dict of test_country() or sweep() and return its id.
+        """
+        sgraph = result.get('s-graph', dict())
+        extra = {k: v for k, v in result.items() if k not in RUN_KEYS}
+        row = [result.get('country'), result.get('dst'), result.get('status', 'DONE'),
+               result.get('nodes'), result.get('edges')]
+        row += [sgraph.get(key) for key, _ in SGRAPH_COLUMNS]
+        row += [json.dumps(extra, default=str) if extra else None, time.time()]
+        with self.conn as conn:
+            cur = conn.execute('INSERT INTO runs (country, dst, status, nodes, edges, paths, sgraph_edges, '
+                               'sgraph_edges_0, sgraph_edges_1, sgraph_edges_2, extra, created) '
+                               'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', row)
+            run_id = cur.lastrowid
+            for solver, r in result.get('solver', dict()).items():
+                solution = r.get('solution')
+                conn.execute('INSERT INTO solvers VALUES (?, ?, ?, ?, ?)',
+                             (run_id, solver, r.get('status'), r.get('time'),
+                              len(solution) if solution is not None else None))
+                if solution is not None:
+                    conn.execute('INSERT INTO solutions VALUES (?, ?, ?)',
+                                 (run_id, solver, zlib.compress(pickle.dumps(solution))))
+        return run_id
+
+    def solution(self, run_id, solver):
+        """
+        Load the solution of `solver` in run `run_id`, or None.
+        """
+        row = self.conn.execute('SELECT payload FROM solutions WHERE run_id = ? AND solver = ?',
+                                (run_id, solver)).fetchone()
+        return pickle.loads(zlib.decompress(row[0])) if row else None
+
+    def load_results(self, where=None, params=(), solutions=False):
+        """
+        Load the runs matching the SQL condition `where` on the columns of
+        the runs table as result dicts, with solutions only if requested.
+        """
+        runs = 'SELECT * FROM runs'
+        if where:
+            runs += ' WHERE ' + where
+        cur = self.conn.execute(runs + ' ORDER BY id', params)
+        names = [d[0] for d in cur.description]
+        results = []
+        index = dict()
+        for row in cur.fetchall():
+            row = dict(zip(names, row))
+            result = json.loads(row['extra']) if row['extra'] else dict()
+            result['id'] = row['id']
+            for key in ('country', 'dst', 'status', 'nodes', 'edges'):
+                result[key] = row[key]
+            if row['paths'] is not None:
+                result['s-graph'] = {key: row[column] for key, column in SGRAPH_COLUMNS}
+                result['solver'] = dict()
+            results.append(result)
+            index[row['id']] = result
+        if not results:
+            return results
+        ids = runs.replace('*', 'id', 1)
+        cur = self.conn.execute('SELECT run_id, solver, status, time, size FROM solvers '
+                                'WHERE run_id IN (%s)' % ids, params)
+        for run_id, solver, status, t, size in cur:
+            index[run_id].setdefault('solver', dict())[solver] = {'status': status, 'time': t, 'size': size}
+        if solutions:
+            cur = self.conn.execute('SELECT run_id, solver, payload FROM solutions '
+                                    'WHERE run_id IN (%s)' % ids, params)
+            for run_id, solver, payload in cur:
+                index[run_id]['solver'][solver]['solution'] = pickle.loads(zlib.decompress(payload))
+        return results
+
+def open_store(dirname):
+    """
+    Open the result store in directory `dirname`.
+    """
+    return ResultStore(os.path.join(dirname, STORE_FILE))
+
+def migrate_pickles(dirname, store):
+    """
+    Append the results pickled in directory `dirname` to `store` and return
+    the number of migrated results.
+    """
+    count = 0
+    for fname in sorted(os.listdir(dirname)):
+        if not fname.endswith('.pickle'):
+            continue
+        with open(os.path.join(dirname, fname), 'rb') as fd:
+            store.append(pickle.load(fd))
+        count += 1
+    return count
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Import a directory of result pickles into a result store.')
+    parser.add_argument('pickle_dir')
+    parser.add_argument('store', nargs='?', default=None,
+                        help='store file, %s in pickle_dir by default' % STORE_FILE)
+    args = parser.parse_args()
+    store = ResultStore(args.store) if args.store else open_store(args.pickle_dir)
+    print('%d results migrated' % migrate_pickles(args.pickle_dir, store))
+    store.close()
@@ -1,55 +1,309 @@
 #!/usr/bin/env python3
 
-import os
+import time
 import random
-import pickle
 import argparse
+import resource
+import multiprocessing
+import multiprocessing.connection
+from collections import deque
 
-from spp_benchmark.reader import TopologyReader, set_dst
-from spp_benchmark.sgraph import SGraph, GreedySolver, GreedyPlusSolver, GreedyPPGraphSolver
-from spp_benchmark.bgp import bgp_sim
+from spp_benchmark.reader import TopologyReader, reset_dst
+from spp_benchmark.sgraph import CompactSGraph, GreedySolver, GreedyPlusSolver, GreedyPPGraphSolver, ExactSGraphSolver, \
+    sgraph_stats, PARALLEL_MIN_PATHS
+from spp_benchmark.bgp import bgp_sim, RibBound
+from spp_benchmark.store import open_store
+from spp_benchmark.instrument import Instrument, NULL_INSTRUMENT
+from spp_benchmark.budget import Budget
+from spp_benchmark.verify import StabilityVerifier
+from spp_benchmark.shared import SharedTopology
 
-def test_country(topo, cc, solvers, dst=None, save_dir=None):
+def save_result(result, save_dir):
     """
-    Test each solver in `solvers` to solve a SPP instance.
+    Append `result` to the result store of `save_dir`, if any.
+    """
+    if save_dir is not None:
+        store = open_store(save_dir)
+        store.append(result)
+        store.close()
+
+def over_budget(result, budget, phase, stats):
+    """
+    Record in `result` that `budget` was exceeded in `phase`, with the
+    partial statistics of that phase, if it was.
+    """
+    if budget is None or budget.exceeded is None:
+        return False
+    result['status'] = 'BUDGET'
+    stats = {k: v for k, v in stats.items() if k != 'budget-exceeded'}
+    result['budget'] = dict(budget.exceeded, phase=phase, stats=stats)
+    return True
+
+def test_country(topo, cc, solvers, dst=None, save_dir=None, instrument=None, budget=None, bound=None,
+                 build_jobs=1):
+    """
+    Test each solver in `solvers` to solve a SPP instance. Each solution is
+    checked by a StabilityVerifier: a complete path assignment which is not
+    stable gets status UNSTABLE, and the ASes violating stability are kept
+    in result['verify'].
 
     topo: Internet AS-level topology
     cc: countrycode to filter a subgraph of the Internet
-    solvers: dist (solver name -> solver instance)
+    solvers: dist (solver name -> solver instance), or None to only count
+             the paths, edges and degrees of the S-graph without building it,
+             the result being stored with status STATS
     dst: destination AS number
-    save_dir: directory to dump test result
+    save_dir: directory of the result store to append the test result to
+    instrument: Instrument measuring the phases of the test, if any
+    budget: Budget of the BGP simulation and S-graph build, if any; a test
+            exceeding it gets status BUDGET and is stored with the exceeded
+            limit and the partial statistics
+    bound: RibBound limiting the permitted paths of each AS, if any; with
+           a top_k, the simulation has no announcement limit, otherwise a
+           test reaching it gets status ANNO_LIMIT and is stored with its
+           number of announcements
+    build_jobs: number of worker processes building the S-graph
     """
+    inst = instrument or NULL_INSTRUMENT
     result = dict()
-    dst = dst or random.choice(list(topo.nodes()))
-    set_dst(topo, dst)
+    if inst.enabled:
+        result['instrument'] = inst.report()
+    if dst is None:
+        dst = random.choice(list(topo.nodes()))
+    with inst.span('reset'):
+        reset_dst(topo, dst)
     print('[[[ Country: %s, ASes: %d, Edges: %d, Dest: %d ]]]' % (cc, len(topo.nodes), len(topo.edges), dst))
     result['country'] = cc
+    result['dst'] = dst
     result['nodes'] = len(topo.nodes)
     result['edges'] = len(topo.edges)
-    succ = bgp_sim(topo, anno_num=5000)
-    if succ:
-        pcg = SGraph()
-        pcg.load(topo)
-        pcg.build()
-        print('[[ SolverGraph: (Paths: %d, Edges: %d) ]]' % (len(pcg.nodes), len(pcg.edges)))
+    bgp_stats = dict()
+    with inst.span('bgp'):
+        unbounded = bound is None or bound.top_k is None
+        succ = bgp_sim(topo, anno_num=5000 if unbounded else None, stats=bgp_stats, budget=budget,
+                       bound=bound)
+    for key, value in bgp_stats.items():
+        inst.set('bgp-' + key, value)
+    if bound is not None:
+        result['rib-bound'] = {'top-k': bound.top_k, 'slack': bound.slack,
+                               'evicted': bound.evicted, 'withdrawn': bound.withdrawn}
+    if over_budget(result, budget, 'bgp', bgp_stats):
+        save_result(result, save_dir)
+    elif not succ:
+        result['status'] = 'ANNO_LIMIT'
+        result['announcements'] = bgp_stats['announcements']
+        save_result(result, save_dir)
+    elif succ and solvers is None:
+        with inst.span('stats'):
+            stats = sgraph_stats(topo, budget=budget)
+        if over_budget(result, budget, 'stats', stats):
+            save_result(result, save_dir)
+        else:
+            print('[[ SolverGraph: (Paths: %d, Edges: %d) ]]' % (stats['permitted-path-num'], stats['edges']))
+            result['status'] = 'STATS'
+            result['degree-histogram'] = {'out': stats.pop('out-degree'), 'in': stats.pop('in-degree')}
+            result['s-graph'] = stats
+            inst.set('paths', stats['permitted-path-num'])
+            for t in range(3):
+                inst.set('edges-%d' % t, stats['edges-%d' % t])
+            save_result(result, save_dir)
+    elif succ:
+        build_stats = dict()
+        with inst.span('build'):
+            pcg = CompactSGraph()
+            pcg.load(topo)
+            pcg.build(budget=budget, stats=build_stats, jobs=build_jobs)
+        if over_budget(result, budget, 'build', build_stats):
+            save_result(result, save_dir)
+            inst.emit(country=cc, dst=dst)
+            print()
+            return result
+        print('[[ SolverGraph: (Paths: %d, Edges: %d) ]]' % (pcg.number_of_nodes(), pcg.number_of_edges()))
         result['s-graph'] = dict()
-        result['s-graph']['permitted-path-num'] = len(pcg.nodes)
-        result['s-graph']['edges'] = len(pcg.edges)
-        result['s-graph']['edges-0'] = len([e for e in pcg.edges if pcg.edges[e]['type'] == 0])
-        result['s-graph']['edges-1'] = len([e for e in pcg.edges if pcg.edges[e]['type'] == 1])
-        result['s-graph']['edges-2'] = len([e for e in pcg.edges if pcg.edges[e]['type'] == 2])
+        result['s-graph']['permitted-path-num'] = pcg.number_of_nodes()
+        result['s-graph']['edges'] = pcg.number_of_edges()
+        result['s-graph']['edges-0'] = pcg.number_of_edges(0)
+        result['s-graph']['edges-1'] = pcg.number_of_edges(1)
+        result['s-graph']['edges-2'] = pcg.number_of_edges(2)
+        inst.set('paths', pcg.number_of_nodes())
+        for t in range(3):
+            inst.set('edges-%d' % t, pcg.number_of_edges(t))
+        with inst.span('verify'):
+            verifier = StabilityVerifier(topo)
         result['solver'] = dict()
+        result['verify'] = dict()
         for solver in solvers:
-            s, succ, t = solvers[solver].solve(pcg, enable_timer=True)
+            with inst.span('solve-' + solver.lower()):
+                s, succ, t = solvers[solver].solve(pcg, enable_timer=True)
+            with inst.span('verify-' + solver.lower()):
+                check = verifier.verify(s)
+            # a complete assignment only succeeds if it is stable
+            status = 'FAILED'
+            if succ:
+                status = 'SUCCESS' if check['stable'] else 'UNSTABLE'
+            violations = dict()
+            for asn, reason in check['violations'].items():
+                violations.setdefault(reason, []).append(asn)
+            result['verify'][solver.lower()] = {'stable': check['stable'], 'complete': check['complete'],
+                                                'violations': violations}
             result['solver'][solver.lower()] = dict()
-            result['solver'][solver.lower()]['status'] = 'SUCCESS' if succ else 'FAILED'
+            result['solver'][solver.lower()]['status'] = status
             result['solver'][solver.lower()]['time'] = t
             result['solver'][solver.lower()]['solution'] = s
-            print('%s [%s in %fs]:' % (solver, ('SUCCESS' if succ else 'FAILED'), t), s)
-        if save_dir is not None:
-            with open(os.path.join(save_dir, '%s-%d.pickle' % (cc, dst)), 'wb') as save_f:
-                pickle.dump(result, save_f)
+            print('%s [%s in %fs]:' % (solver, status, t), s)
+        save_result(result, save_dir)
+    inst.emit(country=cc, dst=dst)
     print()
+    return result
+
+_batch = None
+
+def _test_destination(dst):
+    topo, cc, solvers, save_dir, instrument_opts, budget_opts, bound, build_jobs = _batch
+    instrument = Instrument(**instrument_opts) if instrument_opts is not None else None
+    budget = Budget(**budget_opts) if budget_opts is not None else None
+    return test_country(topo, cc, solvers, dst=dst, save_dir=save_dir, instrument=instrument, budget=budget,
+                        bound=bound, build_jobs=build_jobs)
+
+def test_destinations(topo, cc, solvers, dsts='all', jobs=1, save_dir=None, instrument_opts=None,
+                      budget_opts=None, bound=None, build_jobs=1):
+    """
+    Test each solver in `solvers` on the SPP instances of one topology
+    towards many destinations, yielding each result as soon as it finishes.
+
+    topo: AS-level topology, loaded once and reset for every destination
+    cc: countrycode of the topology
+    solvers: dist (solver name -> solver instance), or None (see test_country)
+    dsts: list of destination AS numbers, or 'all' for every AS of topo
+    jobs: number of worker processes
+    save_dir: directory of the result store to append test results to
+    instrument_opts: keyword arguments of an Instrument for each test, if any
+    budget_opts: keyword arguments of a Budget for each test, if any
+    bound: RibBound of the simulations, if any
+    build_jobs: number of worker processes building each S-graph, only
+                with jobs <= 1 since pool workers cannot have children
+    """
+    global _batch
+    if dsts == 'all':
+        dsts = list(topo.nodes())
+    _batch = (topo, cc, solvers, save_dir, instrument_opts, budget_opts, bound, build_jobs if jobs <= 1 else 1)
+    if jobs <= 1:
+        for dst in dsts:
+            yield _test_destination(dst)
+        return
+    # forked workers inherit the topology instead of unpickling a copy
+    ctx = multiprocessing.get_context('fork')
+    with ctx.Pool(jobs) as pool:
+        for result in pool.imap_unordered(_test_destination, dsts):
+            yield result
+
+def set_mem_limit(mem_limit):
+    """
+    Limit the address space of the current process to `mem_limit` GB.
+    """
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    resource.setrlimit(resource.RLIMIT_AS, (int(mem_limit*1000*1000*1000), hard))
+
+def _sweep_worker(conn, topo_reader, cc, solvers, dst, save_dir, mem_limit, instrument_opts, budget_opts,
+                  bound):
+    try:
+        if mem_limit:
+            set_mem_limit(mem_limit)
+        instrument = Instrument(**instrument_opts) if instrument_opts is not None else None
+        with (instrument or NULL_INSTRUMENT).span('extract'):
+            topo = topo_reader.get_subtopo_by_country(cc, maximum=True)
+        if not len(topo):
+            conn.send(('status', 'EMPTY'))
+            conn.close()
+            return
+        if dst is None:
+            dst = random.choice(list(topo.nodes()))
+        conn.send(('dst', dst))
+        budget = Budget(**budget_opts) if budget_opts is not None else None
+        result = test_country(topo, cc, solvers, dst=dst, save_dir=save_dir, instrument=instrument,
+                              budget=budget, bound=bound)
+        result.setdefault('status', 'DONE')
+        conn.send(('result', result))
+    except MemoryError:
+        topo = result = None
+        conn.send(('status', 'OOM'))
+    except Exception as e:
+        conn.send(('status', 'ERROR: %r' % e))
+    conn.close()
+
+def sweep(topo_reader, tasks, solvers, jobs=1, mem_limit=None, timeout=None, save_dir=None,
+          instrument_opts=None, budget_opts=None, bound=None):
+    """
+    Run (countrycode, dst) tasks, each in its own forked worker process,
+    with at most `jobs` workers at a time. A worker runs a single task
+    under its own memory limit and is terminated after `timeout` seconds.
+    Yield a result for each task as it completes; tasks which run out of
+    memory, time out or crash yield {'country', 'dst', 'status'} records,
+    and tests exceeding their budget or the announcement limit yield
+    results with status BUDGET or ANNO_LIMIT.
+
+    topo_reader: TopologyReader with the full topology loaded, or a
+                 SharedTopology of it with the components of the countries
+    tasks: iterable of (countrycode, dst), dst None for a random AS
+    solvers: dist (solver name -> solver instance), or None (see test_country)
+    mem_limit: memory limit of each worker in GB
+    timeout: wall-clock limit of each task in seconds
+    save_dir: directory of the result store to append test results and
+              failed outcomes to
+    instrument_opts: keyword arguments of an Instrument for each task, if any
+    budget_opts: keyword arguments of a Budget for each task, if any
+    bound: RibBound of the simulations, if any
+    """
+    ctx = multiprocessing.get_context('fork')
+    tasks = deque(tasks)
+    running = dict()
+    while tasks or running:
+        while tasks and len(running) < jobs:
+            cc, dst = tasks.popleft()
+            recv_conn, send_conn = ctx.Pipe(duplex=False)
+            proc = ctx.Process(target=_sweep_worker, daemon=True,
+                               args=(send_conn, topo_reader, cc, solvers, dst, save_dir, mem_limit,
+                                     instrument_opts, budget_opts, bound))
+            proc.start()
+            send_conn.close()
+            deadline = time.monotonic() + timeout if timeout else None
+            running[recv_conn] = {'proc': proc, 'country': cc, 'dst': dst, 'deadline': deadline}
+        deadlines = [t['deadline'] for t in running.values() if t['deadline'] is not None]
+        wait = max(0, min(deadlines) - time.monotonic()) if deadlines else None
+        finished = dict()
+        for conn in multiprocessing.connection.wait(list(running), wait):
+            task = running[conn]
+            try:
+                kind, value = conn.recv()
+            except EOFError:
+                # killed without reporting, e.g., by the kernel OOM killer
+                task['proc'].join()
+                exitcode = task['proc'].exitcode
+                finished[conn] = {'status': 'OOM' if exitcode == -9 else 'ERROR: exit code %s' % exitcode}
+                continue
+            if kind == 'dst':
+                task['dst'] = value
+            elif kind == 'result':
+                finished[conn] = value
+            else:
+                finished[conn] = {'status': value}
+        now = time.monotonic()
+        for conn, task in running.items():
+            if conn not in finished and task['deadline'] is not None and now >= task['deadline']:
+                task['proc'].terminate()
+                finished[conn] = {'status': 'TIMEOUT'}
+        for conn, result in finished.items():
+            task = running.pop(conn)
+            conn.close()
+            task['proc'].join()
+            if result['status'] not in ('DONE', 'STATS'):
+                print('[Warn] %s on country %s, dst %s' % (result['status'], task['country'], task['dst']))
+            if 'country' not in result:
+                # test results, including BUDGET ones, are stored by the worker
+                result['country'] = task['country']
+                result['dst'] = task['dst']
+                save_result(result, save_dir)
+            yield result
 
 def getArgs():
     parser = argparse.ArgumentParser()
@@ -57,29 +311,69 @@ def getArgs():
     parser.add_argument('--as-country', required=True)
     parser.add_argument('--save-dir', required=True)
     parser.add_argument('--country', default=None)
-    parser.add_argument('--dst', default=None)
+    parser.add_argument('--dst', default=None,
+                        help='destination AS, comma separated list of ASes, or "all"')
+    parser.add_argument('--jobs', type=int, default=1)
     parser.add_argument('--as-num-lb', type=int, default=10)
     parser.add_argument('--as-num-ub', type=int, default=50)
     parser.add_argument('--mem-limit', type=int, default=56)
+    parser.add_argument('--timeout', type=int, default=None,
+                        help='wall-clock limit of each sweep task in seconds')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='parse the datasets without using the binary topology cache')
+    parser.add_argument('--instrument', action='store_true',
+                        help='record time, memory and counters of each test phase in the results')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='also record the tracemalloc peak of each phase (implies --instrument)')
+    parser.add_argument('--profile', action='store_true',
+                        help='also run each phase under cProfile (implies --instrument)')
+    parser.add_argument('--instrument-json', default=None,
+                        help='append the measurements of each test as JSON lines to this file (implies --instrument)')
+    parser.add_argument('--max-paths', type=int, default=None,
+                        help='stop a test whose BGP simulation or S-graph exceeds this many paths')
+    parser.add_argument('--max-edges', type=int, default=None,
+                        help='stop a test whose S-graph exceeds this many edges')
+    parser.add_argument('--max-time', type=float, default=None,
+                        help='stop a test whose BGP simulation and S-graph build exceed this many seconds')
+    parser.add_argument('--top-k', type=int, default=None,
+                        help='only keep the k most preferred paths of each AS while simulating BGP')
+    parser.add_argument('--slack', type=int, default=None,
+                        help='only keep the paths of each AS at most this many hops longer than its shortest')
+    parser.add_argument('--stats-only', action='store_true',
+                        help='only count the paths, edges and degrees of each S-graph, without solving it')
+    parser.add_argument('--exact', action='store_true',
+                        help='also run the exact solver, whose memory is quadratic in the paths')
+    parser.add_argument('--exact-budget', type=float, default=60,
+                        help='time budget of the exact solver in seconds')
+    parser.add_argument('--build-jobs', type=int, default=1,
+                        help='number of worker processes building each S-graph of at least %d paths, '
+                             'when tests run one at a time in this process' % PARALLEL_MIN_PATHS)
     return parser.parse_args()
 
 
 if __name__ == '__main__':
-    import sys
-    import resource
     topo_reader = TopologyReader()
     args = getArgs()
 
-    _, hard = resource.getrlimit(resource.RLIMIT_AS)
-    resource.setrlimit(resource.RLIMIT_AS, (args.mem_limit*1000*1000*1000, hard))
+    isolated = not args.country and (args.jobs > 1 or args.timeout)
+    if not isolated:
+        set_mem_limit(args.mem_limit)
+    if args.build_jobs > 1 and (isolated or args.jobs > 1):
+        print('[Warn] --build-jobs is ignored when tests run in worker processes')
+        args.build_jobs = 1
 
     # as_rel_f = sys.argv[1]
     # if args.as_country:
         # as_country_f = sys.argv[2]
-    topo_reader.read_topo(args.as_rel, as_country_file=args.as_country)
+    topo_reader.read_topo(args.as_rel, as_country_file=args.as_country, cache=not args.no_cache)
     # else:
     #     topo_reader.read_topo(as_rel_f)
 
+    instrument_opts = None
+    if args.instrument or args.trace_memory or args.profile or args.instrument_json:
+        instrument_opts = {'memory': args.trace_memory, 'profile': args.profile,
+                           'json_file': args.instrument_json}
+
     gsolver = GreedySolver()
     gpsolver = GreedyPlusSolver()
     gppsolver = GreedyPPGraphSolver()
@@ -88,24 +382,59 @@ if __name__ == '__main__':
         'Greedy+': gpsolver,
         'Greedy++': gppsolver
     }
+    if args.exact:
+        solvers['Exact'] = ExactSGraphSolver(time_budget=args.exact_budget)
+    if args.stats_only:
+        solvers = None
+
+    budget_opts = None
+    if args.max_paths is not None or args.max_edges is not None or args.max_time is not None:
+        budget_opts = {'max_paths': args.max_paths, 'max_edges': args.max_edges, 'max_time': args.max_time}
+
+    bound = None
+    if args.top_k is not None or args.slack is not None:
+        bound = RibBound(top_k=args.top_k, slack=args.slack)
 
     if args.country:
         cc = args.country
         topo = topo_reader.get_subtopo_by_country(cc, maximum=True)
-        dst = None
-        if len(sys.argv) > 4:
-            dst = int(sys.argv[4])
+        dsts = [None]
+        if args.dst == 'all':
+            dsts = 'all'
+        elif args.dst:
+            dsts = [int(d) for d in args.dst.split(',')]
         if len(topo):
-            test_country(topo, cc, solvers, dst=dst, save_dir=args.save_dir)
+            for _ in test_destinations(topo, cc, solvers, dsts=dsts, jobs=args.jobs, save_dir=args.save_dir,
+                                       instrument_opts=instrument_opts, budget_opts=budget_opts, bound=bound,
+                                       build_jobs=args.build_jobs):
+                pass
     else:
         countries = [cc for cc, al in reversed(topo_reader.country_stat()) if args.as_num_lb <= al < args.as_num_ub]
-        for cc in countries:
-            topo = topo_reader.get_subtopo_by_country(cc, maximum=True)
-            if len(topo):
-                try:
-                    test_country(topo, cc, solvers, save_dir=args.save_dir)
-                except MemoryError:
-                    print('[Warn] Memory excepted')
+        if isolated:
+            # share the graph and country components with the workers, and
+            # drop the networkx graph so that they do not inherit it
+            shared = SharedTopology.create(topo_reader, countries)
+            topo_reader.dg = None
+            tasks = [(cc, None) for cc in countries]
+            try:
+                for _ in sweep(shared, tasks, solvers, jobs=args.jobs, mem_limit=args.mem_limit,
+                               timeout=args.timeout, save_dir=args.save_dir, instrument_opts=instrument_opts,
+                               budget_opts=budget_opts, bound=bound):
+                    pass
+            finally:
+                shared.unlink()
+        else:
+            for cc in countries:
+                instrument = Instrument(**instrument_opts) if instrument_opts is not None else None
+                budget = Budget(**budget_opts) if budget_opts is not None else None
+                with (instrument or NULL_INSTRUMENT).span('extract'):
+                    topo = topo_reader.get_subtopo_by_country(cc, maximum=True)
+                if len(topo):
+                    try:
+                        test_country(topo, cc, solvers, save_dir=args.save_dir, instrument=instrument,
+                                     budget=budget, bound=bound, build_jobs=args.build_jobs)
+                    except MemoryError:
+                        print('[Warn] Memory excepted')
     # else:
     #     degs = sorted(list(topo_reader.dg.degree()), key=lambda d: d[1], reverse=True)[:20]
     #     dst = degs[0][0]
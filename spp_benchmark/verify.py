@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+from array import array
+
+from spp_benchmark.sgraph import ranked_paths
+
+class StabilityVerifier(object):
+    """
+    Check the stability of path assignments against the permitted paths of
+    a topology.
+    """
+
+    def __init__(self, topo):
+        self.topo = topo
+        self.tree = topo.path_tree
+        self.ranked = ranked_paths(topo)
+        self.rank = array('i', [-1]) * len(self.tree)
+        for as_paths in self.ranked.values():
+            for i, pid in enumerate(as_paths):
+                self.rank[pid] = i
+
+    def path_id(self, p):
+        """
+        Return the path tree id of path tuple `p`, or -1.
+        """
+        tree = self.tree
+        if not p or p[0] != tree.dst:
+            return -1
+        pid = 0
+        for asn in p[1:]:
+            pid = tree.find(pid, asn)
+            if pid < 0:
+                break
+        return pid
+
+    def assign(self, solution):
+        """
+        Map each AS to the path tree id of its path in `solution`. Return
+        (chosen, violations), with the ASes whose paths are 'not-permitted'
+        or 'duplicate' in `violations`.
+        """
+        tree, rank = self.tree, self.rank
+        chosen = dict()
+        violations = dict()
+        for p in solution:
+            pid = self.path_id(p)
+            if pid < 0 or rank[pid] < 0:
+                violations[p[-1] if p else None] = 'not-permitted'
+                continue
+            asn = tree.last[pid]
+            if asn in chosen:
+                violations[asn] = 'duplicate'
+                continue
+            chosen[asn] = pid
+        return chosen, violations
+
+    def check(self, chosen, violations=None):
+        """
+        Add to `violations` the ASes whose path in the assignment `chosen`
+        is 'inconsistent' with the path of its next hop or 'unstable' (a
+        more preferred path is available), and the ASes without a path in
+        it which have one available ('unassigned'). Return `violations`.
+        """
+        if violations is None:
+            violations = dict()
+        tree = self.tree
+        parent, last, rank = tree.parent, tree.last, self.rank
+        for asn, pid in chosen.items():
+            if pid and chosen.get(last[parent[pid]]) != parent[pid]:
+                violations.setdefault(asn, 'inconsistent')
+        for asn, as_paths in self.ranked.items():
+            pid = chosen.get(asn)
+            for q in as_paths[:len(as_paths) if pid is None else rank[pid]]:
+                if not q or chosen.get(last[parent[q]]) == parent[q]:
+                    violations.setdefault(asn, 'unassigned' if pid is None else 'unstable')
+                    break
+        return violations
+
+    def verify(self, solution):
+        """
+        Check the assignment of the paths in `solution`, at most one per AS.
+        Return {'stable', 'complete', 'violations'}, where `violations` maps
+        the offending ASes to one of 'not-permitted', 'duplicate',
+        'inconsistent', 'unstable' or 'unassigned'.
+        """
+        chosen, violations = self.assign(solution)
+        self.check(chosen, violations)
+        return {
+            'stable': not violations,
+            'complete': len(chosen) == len(self.ranked),
+            'violations': violations,
+        }